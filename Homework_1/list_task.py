@@ -1,3 +1,49 @@
+import heapq
+import os
+import tempfile
+from array import array
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Lists shorter than this are not worth converting to NumPy arrays.
+NUMPY_MIN_LEN = 1000
+
+
+# Return src as a 1-D numeric NumPy array, or None if the fast path
+# does not apply: NumPy is missing, src is short, or its elements are
+# not all ints or all floats (mixing them or using ints beyond 64 bits
+# would change the comparisons). Every element is type-checked, as
+# array.array would also take bools for ints; it does the conversion.
+def _numeric_array(src):
+    if np is None:
+        return None
+    if isinstance(src, np.ndarray):
+        if src.ndim == 1 and src.dtype.kind in "iuf":
+            return src
+        return None
+    if not isinstance(src, list) or len(src) < NUMPY_MIN_LEN:
+        return None
+    types = set(map(type, src))
+    if types == {int}:
+        typecode = "q"
+    elif types == {float}:
+        typecode = "d"
+    else:
+        return None
+    try:
+        return np.frombuffer(array(typecode, src), dtype=typecode)
+    except (TypeError, OverflowError):
+        return None
+
+
+def _from_array(values, like):
+    return values if isinstance(like, np.ndarray) else values.tolist()
+
+
 # Remove equal adjacent elements
 #
 # Example input: [1, 2, 2, 3]
@@ -5,6 +51,12 @@
 def remove_adjacent(src_list):
     if len(src_list) == 0:
         return src_list
+    values = _numeric_array(src_list)
+    if values is not None:
+        keep = np.empty(len(values), dtype=bool)
+        keep[0] = True
+        np.not_equal(values[1:], values[:-1], out=keep[1:])
+        return _from_array(values[keep], src_list)
     dest_list = [src_list[0]]
     for i in range(1, len(src_list)):
         if src_list[i] != src_list[i - 1]:
@@ -17,6 +69,12 @@ def remove_adjacent(src_list):
 # Example input: [2, 4, 6], [1, 3, 5]
 # Example output: [1, 2, 3, 4, 5, 6]
 def linear_merge(list1, list2):
+    array1 = _numeric_array(list1)
+    array2 = _numeric_array(list2) if array1 is not None else None
+    # Lists of ints merged with lists of floats keep their own types.
+    if array2 is not None and (array1.dtype == array2.dtype or
+                               isinstance(list1, np.ndarray)):
+        return _from_array(_merge_arrays(array1, array2), list1)
     first_ind = 0
     second_ind = 0
     first_len = len(list1)
@@ -36,3 +94,130 @@ def linear_merge(list1, list2):
             merged.append(list2[second_ind])
             second_ind += 1
     return merged
+
+
+# Vectorized linear_merge: every element goes to its index in the
+# merged array. On ties the elements of the second array come first,
+# as in the loop of linear_merge.
+def _merge_arrays(array1, array2):
+    merged = np.empty(len(array1) + len(array2),
+                      dtype=np.result_type(array1, array2))
+    index1 = np.arange(len(array1))
+    index1 += np.searchsorted(array2, array1, side="right")
+    index2 = np.arange(len(array2))
+    index2 += np.searchsorted(array1, array2, side="left")
+    merged[index1] = array1
+    merged[index2] = array2
+    return merged
+
+
+# Streaming version of remove_adjacent: works on any iterable
+# and yields the elements instead of building a list.
+#
+# Example input: iter([1, 2, 2, 3])
+# Example output: 1, 2, 3
+def iter_remove_adjacent(iterable):
+    sentinel = previous = object()
+    for item in iterable:
+        if previous is sentinel or item != previous:
+            yield item
+        previous = item
+
+
+# Streaming version of linear_merge: merges two sorted iterables.
+# On equal elements the one from the first iterable goes last,
+# exactly as in linear_merge.
+#
+# Example input: iter([2, 4, 6]), iter([1, 3, 5])
+# Example output: 1, 2, 3, 4, 5, 6
+def iter_linear_merge(iterable1, iterable2):
+    sentinel = object()
+    iterator1 = iter(iterable1)
+    iterator2 = iter(iterable2)
+    first = next(iterator1, sentinel)
+    second = next(iterator2, sentinel)
+    while first is not sentinel and second is not sentinel:
+        if first < second:
+            yield first
+            first = next(iterator1, sentinel)
+        else:
+            yield second
+            second = next(iterator2, sentinel)
+    if first is not sentinel:
+        yield first
+        yield from iterator1
+    if second is not sentinel:
+        yield second
+        yield from iterator2
+
+
+# Merge any number of sorted iterables with a heap in O(n log k).
+# Equal elements keep the order of the iterables they come from.
+#
+# Example input: [1, 4], [2, 5], [3, 6]
+# Example output: 1, 2, 3, 4, 5, 6
+def k_way_merge(*iterables):
+    return heapq.merge(*iterables)
+
+
+def _write_run(lines, temp_dir):
+    run = tempfile.NamedTemporaryFile("w", delete=False, suffix=".run",
+                                      dir=temp_dir)
+    with run:
+        run.writelines(lines)
+    return run.name
+
+
+def _read_run(file_name):
+    with open(file_name) as f:
+        yield from f
+
+
+# Sort the lines of a file which does not fit in memory: sorted runs
+# of at most run_size lines are spilled to temporary files and then
+# merged with k_way_merge, at most max_runs at a time.
+# With unique=True equal adjacent lines are removed while merging.
+# Runs are written to temp_dir, by default the directory of output_name:
+# the default temporary directory is often tmpfs, which is held in RAM.
+def external_sort(input_name, output_name, run_size=10 ** 6,
+                  unique=False, max_runs=64, temp_dir=None):
+    if max_runs < 2:
+        raise ValueError("max_runs must be at least 2")
+    if temp_dir is None:
+        temp_dir = os.path.dirname(os.path.abspath(output_name))
+    runs = []
+    try:
+        with open(input_name) as f:
+            while True:
+                lines = list(islice(f, run_size))
+                if not lines:
+                    break
+                if not lines[-1].endswith("\n"):
+                    lines[-1] += "\n"
+                lines.sort()
+                if unique:
+                    lines = remove_adjacent(lines)
+                runs.append(_write_run(lines, temp_dir))
+        while len(runs) > max_runs:
+            # Too many open files at once: merge the first runs into one.
+            merged = _write_run(_merge_runs(runs[:max_runs], unique),
+                                temp_dir)
+            _remove_runs(runs[:max_runs])
+            runs = runs[max_runs:] + [merged]
+        with open(output_name, "w") as output:
+            output.writelines(_merge_runs(runs, unique))
+    finally:
+        _remove_runs(runs)
+
+
+def _merge_runs(runs, unique):
+    merged = k_way_merge(*map(_read_run, runs))
+    if unique:
+        merged = iter_remove_adjacent(merged)
+    return merged
+
+
+def _remove_runs(runs):
+    for run in runs:
+        if os.path.exists(run):
+            os.remove(run)
@@ -1,3 +1,8 @@
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
 # Given a string, if its length is at least 3,
 # add 'ing' to its end.
 # Unless it already ends in 'ing', in which case
@@ -8,14 +13,11 @@
 # Example input: 'read'
 # Example output: 'reading'
 def verbing(s):
-    len_s = len(s)
-    if len_s < 3:
+    if len(s) < 3:
         return s
-    if s[len_s - 3:len_s] == "ing":
-        s += "ly"
-    else:
-        s += "ing"
-    return s
+    if s.endswith("ing"):
+        return s + "ly"
+    return s + "ing"
 
 
 # Given a string, find the first appearance of the
@@ -27,11 +29,20 @@ def verbing(s):
 # Example input: 'This dinner is not that bad!'
 # Example output: 'This dinner is good!'
 def not_bad(s):
+    # One scan up to the first 'bad' instead of two finds and a replace
+    # over the whole string. A 'bad' before the first 'not' means no
+    # change. Like str.replace, further copies of the 'not'...'bad'
+    # substring are replaced as well, they can only follow the first.
     not_index = s.find("not")
-    bad_index = s.find("bad")
-    if 0 <= not_index < bad_index:
-            s = s.replace(s[not_index:bad_index + 3], "good")
-    return s
+    if not_index < 0 or s.find("bad", 0, not_index) >= 0:
+        return s
+    bad_index = s.find("bad", not_index + 3)
+    if bad_index < 0:
+        return s
+    tail = s[bad_index + 3:]
+    if "not" in tail:
+        tail = tail.replace(s[not_index:bad_index + 3], "good")
+    return s[:not_index] + "good" + tail
 
 
 # Consider dividing a string into two halves.
@@ -49,3 +60,83 @@ def front_back(a, b):
     len_front_b = len(b) - len(b) // 2
     s = a[:len_front_a] + b[:len_front_b] + a[len_front_a:] + b[len_front_b:]
     return s
+
+
+# Batch mode: apply one transform to every line of a large input.
+# Lines are processed in chunks, on a process pool with -j, and
+# written in input order with large buffered writes.
+# front_back takes two tab-separated strings per line.
+
+TRANSFORMS = {"verbing": verbing, "not_bad": not_bad,
+              "front_back": front_back}
+CHUNK_LINES = 2 ** 16
+BUFFER_SIZE = 2 ** 20
+
+
+def _front_back_line(line):
+    a, _, b = line.partition("\t")
+    return front_back(a, b)
+
+
+def transform_lines(name, lines):
+    transform = TRANSFORMS[name]
+    if name == "front_back":
+        transform = _front_back_line
+    return "".join(transform(line.rstrip("\n")) + "\n" for line in lines)
+
+
+def _chunks(lines, size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def transform_stream(name, src, dst, workers=1, chunk_lines=CHUNK_LINES):
+    chunks = _chunks(src, chunk_lines)
+    if workers <= 1:
+        for chunk in chunks:
+            dst.write(transform_lines(name, chunk))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Bounded window of chunks in flight, results in input order.
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(transform_lines, name, chunk))
+            if len(pending) >= 2 * workers:
+                dst.write(pending.popleft().result())
+        for future in pending:
+            dst.write(future.result())
+
+
+def main():
+    args = sys.argv[1:]
+    workers = 1
+    if len(args) > 2 and args[0] == "-j":
+        workers = int(args[1])
+        args = args[2:]
+    if not 1 <= len(args) <= 3 or args[0] not in TRANSFORMS:
+        print("usage: ./string_task.py [-j workers] "
+              "{verbing | not_bad | front_back} [input [output]]")
+        sys.exit(1)
+    src = sys.stdin
+    dst = sys.stdout
+    if len(args) > 1 and args[1] != "-":
+        src = open(args[1], "r", buffering=BUFFER_SIZE)
+    if len(args) > 2:
+        dst = open(args[2], "w", buffering=BUFFER_SIZE)
+    try:
+        transform_stream(args[0], src, dst, workers)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,34 @@ print_words() and print_top().
 
 """
 
+import codecs
+import hashlib
+import json
+import locale
+import mmap
+import os
+import signal
+import stat
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush, nlargest
+
+CHUNK_SIZE = 2 ** 26
+# Ranges are tokenized by blocks of about this size, cut at whitespace,
+# to bound the memory taken by the words of a range.
+TOKEN_BLOCK = 2 ** 20
+INDEX_SUFFIX = ".wcindex"
+INDEX_VERSION = 2
+FINGERPRINT_SIZE = 4096
+WHITESPACE = b" \t\n\r\x0b\x0c"
+# Lowercases ASCII letters and turns the separators which str.split()
+# knows but bytes.split() does not into spaces.
+ASCII_LOWER = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ\x1c\x1d\x1e\x1f",
+                              b"abcdefghijklmnopqrstuvwxyz    ")
+# Encodings, besides latin-* (iso8859-*), in which the bytes below 0x80
+# always are ASCII characters, as named by codecs.lookup().
+ASCII_ENCODINGS = {"ascii", "utf-8"} | {"cp125%d" % i for i in range(9)}
 
 # Define print_words(filename) and print_top(filename) functions.
 # You could write a helper utility function that reads a file
@@ -38,55 +65,388 @@ import sys
 
 
 def read_words(filename):
-    words = []
+    # Words are produced one line at a time, so memory does not
+    # depend on the size of the file. "-" reads standard input.
+    if filename == "-":
+        for line in sys.stdin:
+            yield from line.split()
+        return
     with open(filename, "r") as f:
         for line in f:
-            words.extend(line.split())
-    return words
+            yield from line.split()
 
 
-def build_stat(filename):
-    all_words = read_words(filename)
-    words_stat = {}
-    for current_word in all_words:
-        current_word = current_word.lower()
-        if current_word not in words_stat:
-            words_stat[current_word] = 1
-        else:
-            words_stat[current_word] += 1
+def _filenames(filename):
+    if isinstance(filename, str):
+        return [filename]
+    return list(filename)
+
+
+def _is_regular(filename):
+    # Standard input, pipes and process substitutions have no size and
+    # cannot be mapped: they are read as a stream of lines.
+    if filename == "-":
+        return False
+    try:
+        return stat.S_ISREG(os.stat(filename).st_mode)
+    except OSError:
+        # Let opening the file report the error.
+        return True
+
+
+def _ascii_compatible(encoding):
+    # Bytes may only be cut at whitespace and lowercased if every byte
+    # below 0x80 is an ASCII character on its own. Shift_JIS and Big5,
+    # among others, use such bytes inside multi-byte characters.
+    name = codecs.lookup(encoding).name
+    return name in ASCII_ENCODINGS or name.startswith("iso8859-")
+
+
+def _split_ranges(filename, chunk_size, start=0, size=None):
+    # Cut the file every chunk_size bytes, moving every cut forward
+    # to the next whitespace byte so that no word is split.
+    if size is None:
+        size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, "rb") as f:
+        while start < size:
+            end = start + chunk_size
+            f.seek(end)
+            while end < size:
+                block = f.read(4096)
+                cut = min((i for i in map(block.find, WHITESPACE) if i >= 0),
+                          default=-1)
+                if cut >= 0:
+                    end += cut
+                    break
+                end += len(block)
+            end = min(end, size)
+            ranges.append((filename, start, end))
+            start = end
+    return ranges
+
+
+def _decode_tokens(tokens, encoding):
+    # tokens counts lowercased byte strings split at ASCII whitespace.
+    # Tokens with other characters may hold Unicode whitespace and
+    # capitals: they are split and lowercased again as text.
+    words_stat = Counter()
+    for token, count in tokens.items():
+        if token.isascii():
+            words_stat[token.decode("ascii")] += count
+            continue
+        for word in token.decode(encoding).lower().split():
+            words_stat[word] += count
     return words_stat
 
 
-def print_words(filename):
-    words_stat = build_stat(filename)
+def _block_end(data, start, end, block_size):
+    # End of the block starting at start: just after its last whitespace
+    # byte, so that no word is split between two blocks.
+    stop = min(start + block_size, end)
+    while stop < end:
+        cut = max(data.rfind(WHITESPACE[i:i + 1], start, stop)
+                  for i in range(len(WHITESPACE)))
+        if cut >= 0:
+            return cut + 1
+        # A word longer than the block.
+        stop = min(stop + block_size, end)
+    return stop
+
+
+def _count_range(filename, start, end, encoding, block_size=TOKEN_BLOCK):
+    # Bytes are lowercased and split block by block, and only the
+    # distinct tokens of the whole range are decoded.
+    tokens = Counter()
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            while start < end:
+                stop = _block_end(data, start, end, block_size)
+                tokens.update(data[start:stop].translate(ASCII_LOWER).split())
+                start = stop
+    return _decode_tokens(tokens, encoding)
+
+
+def _count_ranges(ranges, encoding, workers):
+    words_stat = Counter()
+    if workers <= 1 or len(ranges) <= 1:
+        for file_range in ranges:
+            words_stat.update(_count_range(*file_range, encoding))
+        return words_stat
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Partial counters are merged in file order, so that words keep
+        # the order of their first appearance, which decides ties.
+        for partial_stat in executor.map(
+                _count_range, *zip(*ranges),
+                [encoding] * len(ranges)):
+            words_stat.update(partial_stat)
+    return words_stat
+
+
+def _fingerprint(filename, offset):
+    # The first and the last bytes before offset: a file which was
+    # rewritten rather than appended to almost surely changes them.
+    # Together with the inode, size and mtime kept in the index, this
+    # only misses a file rewritten in place, growing it, with the same
+    # bytes at both ends and different bytes in the middle.
+    with open(filename, "rb") as f:
+        head = f.read(min(offset, FINGERPRINT_SIZE))
+        f.seek(max(0, offset - FINGERPRINT_SIZE))
+        tail = f.read(min(offset, FINGERPRINT_SIZE))
+    return hashlib.blake2b(head + tail, digest_size=16).hexdigest()
+
+
+def _last_word_end(filename, size):
+    # Offset just after the last whitespace byte: a word after it may
+    # still grow when the file is appended to.
+    with open(filename, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            block = f.read(end - start)
+            cut = max(block.rfind(char) for char in WHITESPACE)
+            if cut >= 0:
+                return start + cut + 1
+            end = start
+    return 0
+
+
+def _load_index(filename, encoding, file_stat):
+    # A file replaced by a rename has another inode. A file which has
+    # the size it had when indexed but another mtime was rewritten in
+    # place, as appending to it would have made it larger.
+    try:
+        with open(filename + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    offset = index.get("offset", -1)
+    size = index.get("size", -1)
+    if (index.get("version") != INDEX_VERSION or
+            index.get("encoding") != encoding or
+            index.get("device") != file_stat.st_dev or
+            index.get("inode") != file_stat.st_ino or
+            not 0 <= offset <= size <= file_stat.st_size or
+            (size == file_stat.st_size and
+             index.get("mtime") != file_stat.st_mtime_ns) or
+            index.get("fingerprint") != _fingerprint(filename, offset)):
+        return None
+    return index
+
+
+def _save_index(filename, encoding, file_stat, offset, words_stat):
+    index = {"version": INDEX_VERSION, "encoding": encoding,
+             "device": file_stat.st_dev, "inode": file_stat.st_ino,
+             "size": file_stat.st_size, "mtime": file_stat.st_mtime_ns,
+             "offset": offset,
+             "fingerprint": _fingerprint(filename, offset),
+             "words": list(words_stat.items())}
+    temp_name = filename + INDEX_SUFFIX + ".tmp"
+    # The counts are already known: a sidecar which cannot be written,
+    # as in a read-only directory, only costs a full count next time.
+    try:
+        with open(temp_name, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(temp_name, filename + INDEX_SUFFIX)
+    except OSError as error:
+        print("cannot write index for", filename + ":", error.strerror,
+              file=sys.stderr)
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+
+
+def _indexed_stat(filename, encoding, workers, chunk_size):
+    # The sidecar index keeps the counts of the file up to the end of
+    # its last complete word. Only what was appended since is counted;
+    # a rewritten file is counted again from the start.
+    file_stat = os.stat(filename)
+    size = file_stat.st_size
+    index = _load_index(filename, encoding, file_stat)
+    offset = 0
+    words_stat = Counter()
+    if index is not None:
+        offset = index["offset"]
+        words_stat = Counter(dict(index["words"]))
+    word_end = max(offset, _last_word_end(filename, size))
+    words_stat.update(_count_ranges(
+        _split_ranges(filename, chunk_size, offset, word_end),
+        encoding, workers))
+    # The index is also saved when only a partial word was appended,
+    # so that its size and mtime are those of the file.
+    if index is None or word_end != offset or index["size"] != size:
+        _save_index(filename, encoding, file_stat, word_end, words_stat)
+    words_stat.update(_count_ranges(
+        _split_ranges(filename, chunk_size, word_end, size),
+        encoding, workers))
+    return words_stat
+
+
+def build_stat(filename, workers=1, chunk_size=CHUNK_SIZE, use_index=False):
+    # filename may also be a list of files, counted together.
+    # With use_index the counts of every file are kept in a sidecar
+    # file, and later calls only count what was appended to it.
+    filenames = _filenames(filename)
+    encoding = locale.getpreferredencoding(False)
+    words_stat = Counter()
+    ascii_compatible = _ascii_compatible(encoding)
+    # Ranges of consecutive regular files are counted together; files
+    # are still counted in order, as the first appearance breaks ties.
+    ranges = []
+    for name in filenames:
+        if ascii_compatible and _is_regular(name):
+            if use_index:
+                words_stat.update(_indexed_stat(name, encoding, workers,
+                                                chunk_size))
+            else:
+                ranges.extend(_split_ranges(name, chunk_size))
+            continue
+        words_stat.update(_count_ranges(ranges, encoding, workers))
+        ranges = []
+        words_stat.update(word.lower() for word in read_words(name))
+    words_stat.update(_count_ranges(ranges, encoding, workers))
+    return words_stat
+
+
+def print_words(filename, workers=1, use_index=False):
+    words_stat = build_stat(filename, workers, use_index=use_index)
     for word, count in sorted(words_stat.items(), key=lambda item: item[0]):
         print(word, count)
     return
 
 
-def print_top(filename):
-    words_stat = build_stat(filename)
-    items = sorted(words_stat.items(), key=lambda item: item[1], reverse=True)
-    for word, count in items[:20]:
+def print_top(filename, workers=1, use_index=False):
+    words_stat = build_stat(filename, workers, use_index=use_index)
+    # Ties keep the order of first appearance, as the stable sort did.
+    items = nlargest(20, words_stat.items(), key=lambda item: item[1])
+    for word, count in items:
         print(word, count)
     return
 
 
+class SpaceSaving:
+
+    """Approximate word counts in at most `capacity` counters
+    (Metwally, Agrawal, El Abbadi: the Space-Saving algorithm).
+
+    When all counters are taken, a new word replaces the word with the
+    smallest count m and starts from m + 1, remembering m as its error.
+    After n words:
+      - every reported count is at least the true count and at most
+        `error` (<= n / capacity) above it;
+      - every word occurring more than n / capacity times is monitored,
+        so the true top-k is reported whenever the k-th count exceeds
+        n / capacity.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.total = 0
+        self.counters = {}
+        # Lazy min-heap of (count, word): entries may be older than the
+        # counters, they are refreshed when they reach the top.
+        self.heap = []
+
+    def add(self, word):
+        self.total += 1
+        counter = self.counters.get(word)
+        if counter is not None:
+            counter[0] += 1
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[word] = [1, 0]
+            heappush(self.heap, (1, word))
+            return
+        while True:
+            count, evicted = heappop(self.heap)
+            current = self.counters[evicted][0]
+            if current == count:
+                break
+            heappush(self.heap, (current, evicted))
+        del self.counters[evicted]
+        self.counters[word] = [count + 1, count]
+        heappush(self.heap, (count + 1, word))
+
+    def update(self, words):
+        for word in words:
+            self.add(word)
+
+    def top(self, k=20):
+        """Return the k largest (word, count, error) triples."""
+        items = nlargest(k, self.counters.items(),
+                         key=lambda item: item[1][0])
+        return [(word, count, error) for word, (count, error) in items]
+
+    def error_bound(self):
+        return self.total // self.capacity
+
+
+def print_approx_top(filename, capacity=10000, report_every=None):
+    # Reads words until the end of the input, which may never come for
+    # standard input: the current top is printed on SIGUSR1 and every
+    # report_every words.
+    summary = SpaceSaving(capacity)
+
+    def report(*args):
+        print("# words: {}, counts overestimated by at most {}".format(
+            summary.total, summary.error_bound()))
+        for word, count, error in summary.top(20):
+            print(word, count)
+        sys.stdout.flush()
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, report)
+    for name in _filenames(filename):
+        for word in read_words(name):
+            summary.add(word.lower())
+            if report_every and summary.total % report_every == 0:
+                report()
+    report()
+    return summary
+
+
 ###
 
 # This basic command line argument parsing code is provided and
 # calls the print_words() and print_top() functions which you must define.
 def main():
-    if len(sys.argv) != 3:
-        print('usage: ./wordcount.py {--count | --topcount} file')
+    args = sys.argv[1:]
+    workers = 1
+    capacity = 10000
+    report_every = None
+    use_index = False
+    while len(args) > 2 and args[0] in ('-j', '--capacity', '--every',
+                                        '--index'):
+        if args[0] == '--index':
+            use_index = True
+            args = args[1:]
+            continue
+        if args[0] == '-j':
+            workers = int(args[1])
+        elif args[0] == '--capacity':
+            capacity = int(args[1])
+        else:
+            report_every = int(args[1])
+        args = args[2:]
+    if len(args) < 2:
+        print('usage: ./wordcount.py [-j workers] [--index] '
+              '[--capacity counters] [--every words] '
+              '{--count | --topcount | --approx-topcount} file [file ...]')
+        print('  use - as file to read standard input')
+        print('  --index keeps counts in file' + INDEX_SUFFIX +
+              ' and only counts what was appended since')
         sys.exit(1)
 
-    option = sys.argv[1]
-    filename = sys.argv[2]
+    option = args[0]
+    filenames = args[1:]
     if option == '--count':
-        print_words(filename)
+        print_words(filenames, workers, use_index)
     elif option == '--topcount':
-        print_top(filename)
+        print_top(filenames, workers, use_index)
+    elif option == '--approx-topcount':
+        print_approx_top(filenames, capacity, report_every)
     else:
         print('unknown option: ' + option)
         sys.exit(1)
@@ -0,0 +1,139 @@
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+MIN_CHUNK = 2 ** 11
+AVERAGE_BITS = 13
+MAX_CHUNK = 2 ** 16
+# Cut points are computed a segment ahead of the chunk being cut, in
+# blocks small enough for the temporary arrays to stay in the CPU cache.
+SEGMENT_SIZE = 2 ** 22
+SCAN_BLOCK = 2 ** 16
+
+# Gear rolling hash: h = (h << 1) + GEAR[byte]. Bit j of h depends only
+# on the last j + 1 bytes, so testing the low AVERAGE_BITS bits gives a
+# cut condition over a window of AVERAGE_BITS bytes without having to
+# remove the bytes that leave the window.
+GEAR = [int.from_bytes(blake2b(bytes([byte]), digest_size=4).digest(),
+                       'little') for byte in range(256)]
+
+
+def _next_boundary(data, start, length, min_size, max_size, bits):
+    end = min(start + max_size, length)
+    if end - start <= min_size:
+        return end
+    mask = (1 << bits) - 1
+    gear = GEAR
+    first = start + min_size - bits
+    h = 0
+    for offset, byte in enumerate(data[first:end]):
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+        if offset >= bits - 1 and not h & mask:
+            return first + offset + 1
+    return end
+
+
+def _window_hash(values, bits):
+    # The masked gear hash over a window of `bits` bytes is a sum of
+    # shifted table values. It is built by doubling windows,
+    # h_2w(i) = h_w(i) + (h_w(i - w) << w): log2(bits) passes instead of
+    # one per byte of the window.
+    dtype = values.dtype.type
+    h = None
+    width = 0
+    power = values
+    size = 1
+    while size <= bits:
+        if bits & size:
+            if h is None:
+                h = power.copy()
+            else:
+                h[width:] += power[:-width] << dtype(width)
+            width += size
+        if 2 * size <= bits:
+            doubled = power.copy()
+            doubled[size:] += power[:-size] << dtype(size)
+            power = doubled
+        size *= 2
+    return h
+
+
+def _cut_candidates(data, bits, start, stop):
+    # Positions in (start, stop] after which a chunk may end. Only the
+    # low `bits` bits of the hash are tested, so 16-bit arithmetic is
+    # enough for the usual chunk sizes.
+    dtype = np.uint16 if bits <= 16 else np.uint32
+    gear = np.array(GEAR, dtype=np.uint32).astype(dtype)
+    mask = dtype((1 << bits) - 1)
+    candidates = []
+    for block in range(start, stop, SCAN_BLOCK):
+        first = max(0, block - bits + 1)
+        values = np.take(gear, np.frombuffer(
+            data, dtype=np.uint8,
+            count=min(stop, block + SCAN_BLOCK) - first, offset=first))
+        h = _window_hash(values, bits)
+        ends = np.flatnonzero((h & mask) == 0) + first + 1
+        candidates.append(ends[ends > block])
+    return np.concatenate(candidates)
+
+
+def chunk_boundaries(data, min_size=MIN_CHUNK, average_bits=AVERAGE_BITS,
+                     max_size=MAX_CHUNK):
+    """Yield (start, end) of content-defined chunks of data.
+    Chunks are at least min_size (except the last one) and at most
+    max_size bytes long, 2 ** average_bits + min_size bytes on average.
+    Inserting bytes into data only changes the chunks around them.
+    Cut points are computed one segment ahead, so memory does not grow
+    with the size of data."""
+    if min_size < average_bits:
+        raise ValueError('min_size must be at least average_bits')
+    length = len(data)
+    start = 0
+    if np is not None and length > max_size:
+        candidates = np.empty(0, dtype=np.int64)
+        scanned = 0
+        while start < length:
+            end = min(start + max_size, length)
+            if end - start > min_size:
+                while scanned < end:
+                    stop = min(scanned + SEGMENT_SIZE, length)
+                    candidates = np.concatenate((
+                        candidates[candidates > start],
+                        _cut_candidates(data, average_bits, scanned, stop)))
+                    scanned = stop
+                i = np.searchsorted(candidates, start + min_size)
+                if i < len(candidates) and candidates[i] < end:
+                    end = int(candidates[i])
+            yield start, end
+            start = end
+        return
+    while start < length:
+        end = _next_boundary(data, start, length, min_size, max_size,
+                             average_bits)
+        yield start, end
+        start = end
+
+
+def iter_chunks(file_name, min_size=MIN_CHUNK, average_bits=AVERAGE_BITS,
+                max_size=MAX_CHUNK):
+    """Yield (digest, size) of the chunks of a file as they are cut."""
+    with open(file_name, mode='rb', buffering=0) as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            with memoryview(data) as view:
+                for start, end in chunk_boundaries(data, min_size,
+                                                   average_bits, max_size):
+                    digest = blake2b(view[start:end], digest_size=16)
+                    yield digest.digest(), end - start
+
+
+def chunk_file(file_name, min_size=MIN_CHUNK, average_bits=AVERAGE_BITS,
+               max_size=MAX_CHUNK):
+    """Return the list of (digest, size) of the chunks of a file."""
+    return list(iter_chunks(file_name, min_size, average_bits, max_size))
@@ -1,37 +1,841 @@
+import json
 import sys
-from os import walk, path
-from hashlib import sha1 as hasher
-
-
-def print_duplicates(root_directory):
-    block_size = 2 ** 20
-    file_hashes = {}
-    for current_path, folders, files in walk('.'):
-        for file_name in files:
-            if file_name[0] in ['.', '~']:
-                continue;
-
-            with open(path.join(current_path, file_name), mode='rb') as f:
-                my_hasher = hasher()
-                block = f.read(block_size)
-                while block:
-                    my_hasher.update(block)
-                    block = f.read(block_size)
-
-                file_hash = my_hasher.hexdigest()
-                full_file_name = path.join(current_path, file_name)
-                if file_hash not in file_hashes:
-                    file_hashes[file_hash] = [full_file_name]
-                else:
-                    file_hashes[file_hash].append(full_file_name)
-
-    for files_with_hash in file_hashes.values():
-        if len(files_with_hash) > 1:
-            print(*files_with_hash, sep=':')
+from argparse import ArgumentParser
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from filecmp import cmp
+from functools import partial
+from hashlib import blake2b, new as new_hash
+from itertools import chain
+from mmap import mmap, ACCESS_READ
+from os import path, sep, stat, link, replace, remove
+from secrets import token_hex
+from shutil import copystat
+from threading import local
+from time import perf_counter
+
+import inotify
+from chunking import chunk_file, iter_chunks, MIN_CHUNK, AVERAGE_BITS, \
+    MAX_CHUNK
+from hash_cache import HashCache
+from metrics import ScanMetrics
+from path_table import PathTable
+from walker import FileFilter, walk_files
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BLOCK_SIZE = 2 ** 20
+SAMPLE_SIZE = 2 ** 12
+MMAP_THRESHOLD = 2 ** 26
+FICLONE = 0x40049409
+ALGORITHMS = ('sha1', 'sha256', 'blake2b')
+DEFAULT_ALGORITHM = 'sha1'
+HASH_OPTIONS = ('workers', 'processes', 'queue_depth', 'cache_file',
+                'algorithm')
+
+_buffers = local()
+
+
+def _missed(function, item):
+    # A file removed or made unreadable since the walk gives None, so
+    # that it is dropped instead of ending the whole scan.
+    try:
+        return function(item), False
+    except OSError:
+        return None, False
+
+
+class _HashPool:
+
+    """Applies a hash function to files, optionally on a pool of workers.
+    Results always come back in the order of the input files, so the
+    output does not depend on the number of workers."""
+
+    def __init__(self, workers=1, processes=False, queue_depth=None):
+        self.queue_depth = queue_depth or 4 * workers
+        self.executor = None
+        if workers > 1:
+            if processes:
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def map(self, function, items, lookup=None):
+        # Yields (result, hit) in input order; hit is True when lookup
+        # already knew the result and the item was not sent to a worker.
+        # The result is None when the item could not be read.
+        # At most queue_depth items are in flight to bound memory.
+        pending = deque()
+        for item in items:
+            known = lookup(item) if lookup is not None else None
+            future = Future()
+            if known is not None:
+                future.set_result((known, True))
+            elif self.executor is None:
+                future.set_result(_missed(function, item))
+            else:
+                future = self.executor.submit(_missed, function, item)
+            pending.append(future)
+            if len(pending) >= self.queue_depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _new_hasher(algorithm):
+    if algorithm == 'blake2b':
+        # A 128-bit digest is plenty for duplicate detection and
+        # keeps cached and in-memory digests small.
+        return blake2b(digest_size=16)
+    return new_hash(algorithm)
+
+
+def _get_buffer():
+    # One reusable read buffer per thread: no allocation per block.
+    if not hasattr(_buffers, 'view'):
+        _buffers.view = memoryview(bytearray(BLOCK_SIZE))
+    return _buffers.view
+
+
+def _sample_hash(file_name, algorithm=DEFAULT_ALGORITHM):
+    # Hash only the head and the tail of the file: cheap, but enough
+    # to separate most same-sized files before reading them fully.
+    my_hasher = _new_hasher(algorithm)
+    buffer = _get_buffer()[:SAMPLE_SIZE]
+    with open(file_name, mode='rb', buffering=0) as f:
+        bytes_read = f.readinto(buffer)
+        my_hasher.update(buffer[:bytes_read])
+        file_size = f.seek(0, 2)
+        if file_size > SAMPLE_SIZE:
+            f.seek(max(SAMPLE_SIZE, file_size - SAMPLE_SIZE))
+            tail_read = f.readinto(buffer)
+            my_hasher.update(buffer[:tail_read])
+            bytes_read += tail_read
+    return my_hasher.digest(), bytes_read
+
+
+def _full_hash(file_name, algorithm=DEFAULT_ALGORITHM):
+    my_hasher = _new_hasher(algorithm)
+    bytes_read = 0
+    with open(file_name, mode='rb', buffering=0) as f:
+        file_size = f.seek(0, 2)
+        f.seek(0)
+        if file_size >= MMAP_THRESHOLD:
+            with mmap(f.fileno(), 0, access=ACCESS_READ) as mapped:
+                my_hasher.update(mapped)
+            return my_hasher.digest(), file_size
+        buffer = _get_buffer()
+        block_len = f.readinto(buffer)
+        while block_len:
+            my_hasher.update(buffer[:block_len])
+            bytes_read += block_len
+            block_len = f.readinto(buffer)
+    return my_hasher.digest(), bytes_read
+
+
+def _timed(function, file_name):
+    start = perf_counter()
+    file_hash, bytes_read = function(file_name)
+    return file_hash, bytes_read, perf_counter() - start
+
+
+def _group_by(file_ids, keys):
+    # A None key marks a file that could not be read: it is left out.
+    groups = {}
+    for file_id, key in zip(file_ids, keys):
+        if key is not None:
+            groups.setdefault(key, []).append(file_id)
+    return [(key, group) for key, group in groups.items() if len(group) > 1]
+
+
+def _group_by_size(table, file_ids):
+    # Sorting ids by size needs no per-size dict, which matters when
+    # almost every one of millions of files has a unique size. Groups
+    # are yielded by increasing size, ids of a group in walk order.
+    if np is not None:
+        yield from _group_by_size_numpy(table, file_ids)
+        return
+    file_ids = sorted(file_ids, key=table.sizes.__getitem__)
+    start = 0
+    for end in range(1, len(file_ids) + 1):
+        if (end == len(file_ids) or
+                table.sizes[file_ids[end]] != table.sizes[file_ids[start]]):
+            if end - start > 1:
+                yield file_ids[start:end]
+            start = end
+
+
+def _group_by_size_numpy(table, file_ids):
+    # A stable argsort of the sizes takes 8 bytes per file instead of
+    # a Python int and a list slot; only duplicate sizes become lists.
+    if len(file_ids) < 2:
+        return
+    ids = np.array(file_ids, dtype=np.uint64)
+    sizes = np.frombuffer(table.sizes, dtype=np.uint64)[ids]
+    order = np.argsort(sizes, kind='stable')
+    sizes = sizes[order]
+    ids = ids[order]
+    del order
+    bounds = np.flatnonzero(sizes[1:] != sizes[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(ids)]))
+    for start, end in zip(starts[ends - starts > 1].tolist(),
+                          ends[ends - starts > 1].tolist()):
+        yield ids[start:end].tolist()
+
+
+def _hash_groups(table, groups, pool, function, cache, column, metrics):
+    # Files of consecutive groups share the pool, so it is never drained
+    # between two small groups, yet every group is split into its
+    # same-hash subgroups as soon as its last file is hashed.
+    groups = iter(groups)
+    pending = deque()
+
+    def file_names():
+        for group in groups:
+            pending.append(group)
+            for file_id in group:
+                yield table.path(file_id)
+
+    lookup = None
+    if cache is not None:
+        lookup = partial(cache.get, column)
+    results = pool.map(partial(_timed, function), file_names(), lookup)
+    while True:
+        hashes = []
+        for result, hit in results:
+            if hit:
+                file_hash = result
+                if metrics is not None:
+                    metrics.hashed(column, 0, 0.0, hit=True)
+            elif result is None:
+                file_hash = None
+                print('cannot read', table.path(pending[0][len(hashes)]),
+                      file=sys.stderr)
+            else:
+                file_hash, bytes_read, seconds = result
+                if cache is not None:
+                    cache.put(column, table.path(pending[0][len(hashes)]),
+                              file_hash)
+                if metrics is not None:
+                    metrics.hashed(column, bytes_read, seconds)
+            hashes.append(file_hash)
+            if len(hashes) == len(pending[0]):
+                break
+        if not pending:
+            return
+        yield from _group_by(pending.popleft(), hashes)
+
+
+def _scan(roots, walk_options, metrics):
+    # Hardlinks share their content, so every (device, inode) is hashed
+    # once through its first path; the other paths are kept in links.
+    # Only files with several links need to be looked up by inode.
+    table = PathTable()
+    representatives = array('L')
+    first_links = {}
+    links = {}
+    for directory, file_name, file_stat in walk_files(roots, **walk_options):
+        file_id = table.add(directory, file_name, file_stat)
+        if metrics is not None:
+            metrics.walked(file_stat.st_size)
+        if file_stat.st_nlink > 1:
+            inode = table.inode(file_id)
+            first = first_links.setdefault(inode, file_id)
+            if first != file_id:
+                links.setdefault(first, [first]).append(file_id)
+                continue
+        representatives.append(file_id)
+    return table, representatives, links
+
+
+def _iter_duplicate_inodes(root_directory, metrics=None, **options):
+    # root_directory is a path or a list of paths.
+    # Groups are yielded as (table, links, digest, group of file ids).
+    roots = root_directory
+    if isinstance(roots, str):
+        roots = [roots]
+    hash_options = {key: options.pop(key) for key in HASH_OPTIONS
+                    if key in options}
+    table, representatives, links = _scan(roots, options, metrics)
+    for digest, group in _iter_table_duplicates(roots, table,
+                                                representatives,
+                                                metrics=metrics,
+                                                **hash_options):
+        yield table, links, digest, group
+
+
+def _iter_table_duplicates(roots, table, representatives, workers=1,
+                           processes=False, queue_depth=None,
+                           cache_file=None, algorithm=DEFAULT_ALGORITHM,
+                           metrics=None):
+    # Stage 1: only files sharing a size can be duplicates.
+    # Stage 2: hash a small head/tail sample of each candidate.
+    # Stage 3: hash the full content of files that still collide.
+    # The sample of a file of at most 2 * SAMPLE_SIZE bytes is all of
+    # it, in order: its digest is the full digest and stage 3 is skipped.
+    if metrics is not None:
+        metrics.walk_finished()
+    # Groups come by increasing size: small groups are all first.
+    same_size = _group_by_size(table, representatives)
+    first_large = []
+
+    def small_groups():
+        for group in same_size:
+            if table.sizes[group[0]] > 2 * SAMPLE_SIZE:
+                first_large.append(group)
+                return
+            yield group
+
+    cache = None
+    if cache_file is not None:
+        cache = HashCache(cache_file, roots, algorithm)
+    sample_hash = partial(_sample_hash, algorithm=algorithm)
+    full_hash = partial(_full_hash, algorithm=algorithm)
+    # False when the scan is interrupted, by an error or by a consumer
+    # that stops iterating early.
+    finished = False
+    try:
+        with _HashPool(workers, processes, queue_depth) as pool:
+            yield from _hash_groups(table, small_groups(), pool,
+                                    sample_hash, cache, 'sample', metrics)
+            same_sample = (group for sample, group in _hash_groups(
+                table, chain(first_large, same_size), pool, sample_hash,
+                cache, 'sample', metrics))
+            yield from _hash_groups(table, same_sample, pool, full_hash,
+                                    cache, 'digest', metrics)
+        finished = True
+    finally:
+        if cache is not None:
+            cache.close(finished)
+        if metrics is not None:
+            metrics.finish()
+
+
+def iter_duplicates(root_directory, **options):
+    for table, links, digest, group in _iter_duplicate_inodes(
+            root_directory, **options):
+        yield [table.path(file_id) for inode in group
+               for file_id in links.get(inode, [inode])]
+
+
+def find_duplicates(root_directory, **options):
+    return list(iter_duplicates(root_directory, **options))
+
+
+def print_duplicates(root_directory, json_lines=False, out=None,
+                     **options):
+    # Every group is printed as soon as it is confirmed.
+    out = sys.stdout if out is None else out
+    for table, links, digest, group in _iter_duplicate_inodes(
+            root_directory, **options):
+        files_with_hash = [table.path(file_id) for inode in group
+                           for file_id in links.get(inode, [inode])]
+        if json_lines:
+            print(json.dumps({'digest': digest.hex(),
+                              'size': table.sizes[group[0]],
+                              'files': files_with_hash}), file=out)
+        else:
+            print(*files_with_hash, sep=':', file=out)
+        out.flush()
+
+
+def analyze_chunks(root_directory, workers=1, processes=False,
+                   queue_depth=None, metrics=None, json_lines=False,
+                   out=None, min_chunk=MIN_CHUNK,
+                   average_bits=AVERAGE_BITS, max_chunk=MAX_CHUNK,
+                   **walk_options):
+    """Split files into content-defined chunks and report which files
+    share chunks and how many bytes a block-level dedup store would save.
+    Returns (total bytes, unique bytes).
+
+    Every distinct chunk is kept in memory (about 120 bytes each, so
+    over 1 GB per 100 GB of distinct data with the default sizes).
+    With one worker the chunks of a file are streamed; with several,
+    each file in flight holds the list of its chunks."""
+    out = sys.stdout if out is None else out
+    roots = root_directory
+    if isinstance(roots, str):
+        roots = [roots]
+    table, representatives, links = _scan(roots, walk_options, metrics)
+    if metrics is not None:
+        metrics.walk_finished()
+    # Every chunk remembers only the first file it was seen in, and
+    # shared bytes are counted against that file: memory grows with the
+    # number of distinct chunks, not with the number of file pairs.
+    owners = {}
+    shared = {}
+    total = 0
+    unique = 0
+    chunk_options = dict(min_size=min_chunk, average_bits=average_bits,
+                         max_size=max_chunk)
+    file_names = (table.path(file_id) for file_id in representatives)
+    with _HashPool(workers, processes, queue_depth) as pool:
+        if pool.executor is None:
+            results = ((iter_chunks(file_name, **chunk_options), False)
+                       for file_name in file_names)
+        else:
+            results = pool.map(partial(chunk_file, **chunk_options),
+                               file_names)
+        for file_id, (chunks, hit) in zip(representatives, results):
+            if chunks is None:
+                print('cannot read', table.path(file_id), file=sys.stderr)
+                continue
+            try:
+                # Streamed chunks can fail in the middle of the file.
+                for digest, size in chunks:
+                    total += size
+                    owner = owners.get(digest)
+                    if owner is None:
+                        owners[digest] = file_id
+                        unique += size
+                    elif owner != file_id:
+                        pair = (owner, file_id)
+                        shared[pair] = shared.get(pair, 0) + size
+            except OSError:
+                print('cannot read', table.path(file_id), file=sys.stderr)
+                continue
+            if metrics is not None:
+                metrics.hashed('chunks', table.sizes[file_id], 0.0)
+    for (owner, file_id), size in sorted(shared.items()):
+        files = [table.path(owner), table.path(file_id)]
+        if json_lines:
+            print(json.dumps({'files': files, 'shared': size}), file=out)
+        else:
+            print(':'.join(files), size, file=out)
+    saved = total - unique
+    if json_lines:
+        print(json.dumps({'total': total, 'unique': unique, 'saved': saved,
+                          'chunks': len(owners)}), file=out)
+    else:
+        print('{} bytes in {} distinct chunks, {} unique bytes, '
+              'dedup would save {} bytes ({:.1f}%)'.format(
+                  total, len(owners), unique, saved,
+                  100.0 * saved / total if total else 0.0), file=out)
+    if metrics is not None:
+        metrics.finish()
+    return total, unique
+
+
+def _reflink(source, target):
+    # The target is created exclusively, an existing file is never
+    # truncated. fcntl is imported here, as it is missing on Windows.
+    from fcntl import ioctl
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        try:
+            ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            remove(target)
+            raise
+
+
+def _replace_with_link(original, replaced, mode):
+    # The link is made under a new random name next to the replaced
+    # file, then renamed over it. Only a name created here is removed.
+    directory, name = path.split(replaced)
+    while True:
+        temp_name = path.join(directory, '.{}.{}.dedup'.format(
+            name, token_hex(4)))
+        try:
+            if mode == 'hardlink':
+                link(original, temp_name)
+            else:
+                _reflink(original, temp_name)
+            break
+        except FileExistsError:
+            continue
+    try:
+        if mode != 'hardlink':
+            # The clone keeps the metadata of the file it replaces.
+            copystat(replaced, temp_name)
+        replace(temp_name, replaced)
+    except OSError:
+        remove(temp_name)
+        raise
+
+
+def _unchanged(table, file_id, file_name):
+    try:
+        return table.unchanged(file_id, stat(file_name))
+    except OSError:
+        return False
+
+
+def link_duplicates(root_directory, mode='hardlink', dry_run=False,
+                    out=None, **options):
+    """Replace every duplicate with a hardlink or a reflink to the first
+    file of its group and return the number of bytes reclaimed.
+    Only inodes whose links were all replaced count as reclaimed.
+    Empty files are never linked: it frees nothing and would tie
+    together unrelated placeholder files."""
+    out = sys.stdout if out is None else out
+    reclaimed = 0
+    for table, links, digest, group in _iter_duplicate_inodes(
+            root_directory, **options):
+        if table.sizes[group[0]] == 0:
+            continue
+        original = table.path(group[0])
+        if not dry_run and not _unchanged(table, group[0], original):
+            print('skip (changed):', original, file=out)
+            continue
+        for inode in group[1:]:
+            file_ids = links.get(inode, [inode])
+            if (mode == 'hardlink' and
+                    table.devices[inode] != table.devices[group[0]]):
+                print('skip (other device):', table.path(inode), file=out)
+                continue
+            if not dry_run and not all(
+                    _unchanged(table, inode, table.path(file_id))
+                    for file_id in file_ids):
+                print('skip (changed):', table.path(inode), file=out)
+                continue
+            try:
+                # The stat can miss a change made within the same mtime
+                # tick: the contents are compared right before linking.
+                if not dry_run and not cmp(original, table.path(inode),
+                                           shallow=False):
+                    print('skip (changed):', table.path(inode), file=out)
+                    continue
+                for file_id in file_ids:
+                    file_name = table.path(file_id)
+                    print(mode, original, '->', file_name, file=out)
+                    if not dry_run:
+                        _replace_with_link(original, file_name, mode)
+            except OSError as error:
+                print('skip ({}):'.format(error.strerror), table.path(inode),
+                      file=out)
+                continue
+            # The inode is only freed if none of its links is left:
+            # links outside the scanned roots keep it alive.
+            if len(file_ids) < table.nlinks[inode]:
+                print('no space reclaimed (linked outside the scan):',
+                      table.path(inode), file=out)
+                continue
+            reclaimed += table.sizes[inode]
+    action = 'would reclaim' if dry_run else 'reclaimed'
+    print(action, reclaimed, 'bytes', file=out)
+    return reclaimed
+
+
+class _DuplicateWatcher:
+
+    """Keeps duplicate groups up to date from inotify events.
+    Files are indexed by size, and the full digest of a file is computed
+    only once another file has the same size. Every change of a group
+    is printed as it happens: '+' and the files of a new or changed
+    group, '-' and the old files of a group that is gone."""
+
+    WATCH_MASK = (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO |
+                  inotify.IN_MOVED_FROM | inotify.IN_CREATE |
+                  inotify.IN_DELETE | inotify.IN_ONLYDIR)
+    FILTER_OPTIONS = ('exclude', 'min_size', 'max_size', 'min_age',
+                      'max_age')
+
+    def __init__(self, roots, json_lines, out, options):
+        self.roots = roots
+        self.json_lines = json_lines
+        self.out = out
+        self.algorithm = options.get('algorithm', DEFAULT_ALGORITHM)
+        self.hash_options = {key: options[key] for key in HASH_OPTIONS
+                             if key in options}
+        self.walk_options = {key: options[key] for key in options
+                             if key not in HASH_OPTIONS + ('metrics',)}
+        self.file_filter = FileFilter(**{
+            key: options[key] for key in self.FILTER_OPTIONS
+            if key in options})
+        self.inotify = inotify.Inotify()
+        self.reported = {}
+
+    def scan(self):
+        # Groups reported before a rescan are kept, so that only the
+        # differences are printed again.
+        self.files = {}
+        self.by_size = {}
+        self.digests = {}
+        self.by_digest = {}
+        table, representatives, links = _scan(
+            self.roots, dict(self.walk_options,
+                             on_directory=self._watch), None)
+        for file_id in range(len(table)):
+            self._index(table.path(file_id), table.sizes[file_id],
+                        table.inode(file_id), table.mtimes[file_id])
+        for digest, group in _iter_table_duplicates(
+                self.roots, table, representatives, **self.hash_options):
+            for inode in group:
+                for file_id in links.get(inode, [inode]):
+                    self._set_digest(table.path(file_id), digest)
+            self._emit([digest])
+        self._emit(list(self.reported))
+
+    def _watch(self, directory):
+        try:
+            self.inotify.add_watch(directory, self.WATCH_MASK)
+        except OSError as error:
+            print('cannot watch', directory, error.strerror, file=sys.stderr)
+
+    def _index(self, file_name, size, inode, mtime):
+        self.files[file_name] = (size, inode, mtime)
+        self.by_size.setdefault(size, set()).add(file_name)
+
+    def _set_digest(self, file_name, digest):
+        self.digests[file_name] = digest
+        self.by_digest.setdefault(digest, set()).add(file_name)
+
+    def _remove(self, file_name):
+        if file_name not in self.files:
+            return []
+        size = self.files.pop(file_name)[0]
+        self.by_size[size].discard(file_name)
+        if not self.by_size[size]:
+            del self.by_size[size]
+        digest = self.digests.pop(file_name, None)
+        if digest is None:
+            return []
+        self.by_digest[digest].discard(file_name)
+        return [digest]
+
+    def _excluded(self, file_name):
+        # True when file_name or one of its directories below the watched
+        # root matches an exclusion rule, as the walk would not reach it.
+        for root in self.roots:
+            prefix = path.join(root, '')
+            if file_name.startswith(prefix):
+                break
+        else:
+            return False
+        current = root
+        for name in file_name[len(prefix):].split(sep):
+            current = path.join(current, name)
+            if self.file_filter.excluded(name, current):
+                return True
+        return False
+
+    def _update(self, file_name):
+        # Returns the digests of the groups which may have changed.
+        changed = self._remove(file_name)
+        if self._excluded(file_name):
+            return changed
+        try:
+            file_stat = stat(file_name, follow_symlinks=False)
+        except OSError:
+            return changed
+        if not self.file_filter.accepts(path.basename(file_name),
+                                        file_name, file_stat):
+            return changed
+        size = file_stat.st_size
+        self._index(file_name, size, (file_stat.st_dev, file_stat.st_ino),
+                    file_stat.st_mtime_ns)
+        if len(self.by_size[size]) < 2:
+            return changed
+        for same_size in list(self.by_size[size]):
+            if same_size in self.digests:
+                continue
+            try:
+                digest = _full_hash(same_size, self.algorithm)[0]
+            except OSError:
+                changed.extend(self._remove(same_size))
+                continue
+            self._set_digest(same_size, digest)
+            changed.append(digest)
+        return changed
+
+    def _group(self, digest):
+        files = sorted(self.by_digest.get(digest, ()))
+        inodes = set(self.files[file_name][1] for file_name in files)
+        return files if len(inodes) > 1 else []
+
+    def _emit(self, digests):
+        for digest in set(digests):
+            files = self._group(digest)
+            old_files = self.reported.get(digest, [])
+            if files == old_files:
+                continue
+            if files:
+                self.reported[digest] = files
+                event, event_files = '+', files
+            else:
+                del self.reported[digest]
+                event, event_files = '-', old_files
+            if not self.by_digest.get(digest):
+                self.by_digest.pop(digest, None)
+            if self.json_lines:
+                print(json.dumps({'event': event, 'digest': digest.hex(),
+                                  'files': event_files}), file=self.out)
+            else:
+                print(event, ':'.join(event_files), file=self.out)
+        self.out.flush()
+
+    def _handle(self, directory, mask, name):
+        file_name = path.join(directory, name)
+        prefix = path.join(file_name, '')
+        if mask & inotify.IN_ISDIR:
+            if mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                if self._excluded(file_name):
+                    return []
+                changed = []
+                for sub_directory, sub_name, file_stat in walk_files(
+                        [file_name], on_directory=self._watch,
+                        **self.walk_options):
+                    changed.extend(
+                        self._update(path.join(sub_directory, sub_name)))
+                return changed
+            if mask & inotify.IN_MOVED_FROM:
+                changed = []
+                for old_name in [old_name for old_name in self.files
+                                 if old_name.startswith(prefix)]:
+                    changed.extend(self._remove(old_name))
+                return changed
+            return []
+        if mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+            return self._remove(file_name)
+        return self._update(file_name)
+
+    def run(self):
+        self.scan()
+        while True:
+            changed = []
+            for directory, mask, cookie, name in self.inotify.read():
+                if mask & inotify.IN_Q_OVERFLOW:
+                    # Events were lost: only a full rescan is reliable.
+                    self.scan()
+                    changed = []
+                    break
+                if directory is not None and name:
+                    changed.extend(self._handle(directory, mask, name))
+            self._emit(changed)
+
+    def close(self):
+        self.inotify.close()
+
+
+def watch_duplicates(root_directory, json_lines=False, out=None,
+                     **options):
+    """Print the duplicates under root_directory, then keep watching it
+    with inotify and print every change of the duplicate groups."""
+    out = sys.stdout if out is None else out
+    roots = root_directory
+    if isinstance(roots, str):
+        roots = [roots]
+    watcher = _DuplicateWatcher(roots, json_lines, out, options)
+    try:
+        watcher.run()
+    finally:
+        watcher.close()
+
+
+def _parse_args(args):
+    parser = ArgumentParser(description='Print groups of duplicate files.')
+    parser.add_argument('root_directory', nargs='+')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of files hashed in parallel')
+    parser.add_argument('--processes', action='store_true',
+                        help='hash on a process pool instead of threads')
+    parser.add_argument('--queue-depth', type=int, default=None,
+                        help='maximum number of files queued to the workers')
+    parser.add_argument('--cache', metavar='FILE', default=None,
+                        help='SQLite file keeping digests between scans')
+    parser.add_argument('--algorithm', choices=ALGORITHMS,
+                        default=DEFAULT_ALGORITHM,
+                        help='digest used to compare files')
+    parser.add_argument('--timing', action='store_true',
+                        help='print time and throughput of the scan')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='append progress snapshots as JSON lines')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        metavar='SECONDS',
+                        help='time between two progress snapshots')
+    parser.add_argument('--link', choices=('hardlink', 'reflink'),
+                        default=None,
+                        help='replace duplicates with links to one copy')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='with --link, only report what would be done')
+    parser.add_argument('--json', action='store_true',
+                        help='print every group as a JSON line')
+    parser.add_argument('--exclude', metavar='GLOB', action='append',
+                        default=[],
+                        help='skip files and directories matching GLOB')
+    parser.add_argument('--min-size', type=int, default=0,
+                        help='skip files smaller than this many bytes')
+    parser.add_argument('--max-size', type=int, default=None,
+                        help='skip files larger than this many bytes')
+    parser.add_argument('--min-age', type=float, default=None,
+                        help='skip files modified less than DAYS ago',
+                        metavar='DAYS')
+    parser.add_argument('--max-age', type=float, default=None,
+                        help='skip files modified more than DAYS ago',
+                        metavar='DAYS')
+    parser.add_argument('-x', '--one-file-system', action='store_true',
+                        help='do not cross filesystem boundaries')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and print changes of the '
+                             'duplicate groups (Linux inotify)')
+    parser.add_argument('--chunks', action='store_true',
+                        help='report content shared between files using '
+                             'content-defined chunks')
+    parser.add_argument('--min-chunk', type=int, default=MIN_CHUNK,
+                        help='minimum chunk size in bytes')
+    parser.add_argument('--average-chunk-bits', type=int,
+                        default=AVERAGE_BITS,
+                        help='chunks are about 2 ** BITS bytes '
+                             'over the minimum')
+    parser.add_argument('--max-chunk', type=int, default=MAX_CHUNK,
+                        help='maximum chunk size in bytes')
+    return parser.parse_args(args)
+
+def _days(days):
+    return None if days is None else days * 24 * 60 * 60
 
 def main():
-    root_directory = sys.argv[1]
-    print_duplicates(root_directory)
+    args = _parse_args(sys.argv[1:])
+    metrics_file = None
+    metrics = None
+    if args.metrics is not None:
+        metrics_file = open(args.metrics, 'a')
+    if args.timing or metrics_file is not None:
+        metrics = ScanMetrics(metrics_file, args.metrics_interval)
+    options = dict(workers=args.workers, processes=args.processes,
+                   queue_depth=args.queue_depth, cache_file=args.cache,
+                   algorithm=args.algorithm, metrics=metrics,
+                   exclude=args.exclude, min_size=args.min_size,
+                   max_size=args.max_size,
+                   min_age=_days(args.min_age), max_age=_days(args.max_age),
+                   one_file_system=args.one_file_system)
+    try:
+        if args.chunks:
+            del options['cache_file'], options['algorithm']
+            analyze_chunks(args.root_directory, json_lines=args.json,
+                           min_chunk=args.min_chunk,
+                           average_bits=args.average_chunk_bits,
+                           max_chunk=args.max_chunk, **options)
+        elif args.watch:
+            watch_duplicates(args.root_directory, args.json, **options)
+        elif args.link is None:
+            print_duplicates(args.root_directory, args.json, **options)
+        else:
+            link_duplicates(args.root_directory, args.link, args.dry_run,
+                            **options)
+    finally:
+        if metrics is not None:
+            metrics.stop()
+        if metrics_file is not None:
+            metrics_file.close()
+    if args.timing:
+        metrics.report(args.algorithm)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,111 @@
+import sqlite3
+from os import path, stat
+from time import monotonic
+
+
+COMMIT_INTERVAL = 30.0
+
+
+class HashCache:
+
+    """HashCache - persistent storage of file digests between scans.
+    A digest is reused only while the path still points to the same
+    device/inode with the same size and modification time and was
+    computed with the same algorithm.
+    Digests are committed every commit_interval seconds, so that an
+    interrupted scan keeps what it computed. Entries under the scanned
+    roots which were not used are pruned only when the scan finished."""
+
+    def __init__(self, file_name, roots, algorithm='sha1',
+                 commit_interval=COMMIT_INTERVAL):
+        self.algorithm = algorithm
+        self.commit_interval = commit_interval
+        self.last_commit = monotonic()
+        self.roots = [path.join(path.abspath(root), '') for root in roots]
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                device INTEGER, inode INTEGER, size INTEGER, mtime INTEGER,
+                algorithm TEXT,
+                sample BLOB, digest BLOB, generation INTEGER)""")
+        row = self.connection.execute(
+            "SELECT MAX(generation) FROM hashes").fetchone()
+        self.generation = (row[0] or 0) + 1
+        self.keys = {}
+
+    def _key(self, file_name):
+        file_stat = stat(file_name)
+        return (path.abspath(file_name), file_stat.st_dev, file_stat.st_ino,
+                file_stat.st_size, file_stat.st_mtime_ns, self.algorithm)
+
+    def get(self, column, file_name):
+        # Remember the stat taken before hashing, so that a file modified
+        # while being hashed is not stored with its new mtime.
+        try:
+            key = self.keys[file_name] = self._key(file_name)
+        except OSError:
+            # Gone since the walk: hashing it will fail and drop it.
+            return None
+        row = self.connection.execute(
+            "SELECT device, inode, size, mtime, algorithm, " + column +
+            " FROM hashes WHERE path = ?", key[:1]).fetchone()
+        if row is None or row[:5] != key[1:] or row[5] is None:
+            return None
+        del self.keys[file_name]
+        self.connection.execute(
+            "UPDATE hashes SET generation = ? WHERE path = ?",
+            (self.generation, key[0]))
+        self._tick()
+        return row[5]
+
+    def put(self, column, file_name, value):
+        key = self.keys.pop(file_name, None)
+        if key is None:
+            try:
+                key = self._key(file_name)
+            except OSError:
+                return
+        row = self.connection.execute(
+            "SELECT device, inode, size, mtime, algorithm FROM hashes "
+            "WHERE path = ?",
+            key[:1]).fetchone()
+        if row is not None and row != key[1:]:
+            # The file changed: every digest stored for it is stale.
+            self.connection.execute(
+                "DELETE FROM hashes WHERE path = ?", key[:1])
+        self.connection.execute(
+            "INSERT OR IGNORE INTO hashes "
+            "(path, device, inode, size, mtime, algorithm) "
+            "VALUES (?, ?, ?, ?, ?, ?)", key)
+        self.connection.execute(
+            "UPDATE hashes SET " + column + " = ?, generation = ? "
+            "WHERE path = ?", (value, self.generation, key[0]))
+        self._tick()
+
+    def _tick(self):
+        now = monotonic()
+        if now - self.last_commit >= self.commit_interval:
+            self.last_commit = now
+            self.connection.commit()
+
+    def prune(self):
+        for root in self.roots:
+            self.connection.execute(
+                "DELETE FROM hashes WHERE generation < ? "
+                "AND substr(path, 1, ?) = ?",
+                (self.generation, len(root), root))
+
+    def close(self, finished=True):
+        # Rows not seen by an interrupted scan are still valid: only a
+        # scan that visited every file may prune.
+        if finished:
+            self.prune()
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(finished=exc_type is None)
@@ -0,0 +1,135 @@
+import json
+import sys
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+
+
+class ScanMetrics:
+
+    """ScanMetrics - counters of a duplicate scan.
+    Counts walked files (with a histogram of their sizes by power of
+    two), hashed files, cache hits and bytes read per hashing stage,
+    and the wall time spent walking and hashing. With an output file
+    a snapshot is written as one JSON line every interval seconds, by a
+    timer thread so that hashing a large file does not delay it, and
+    once more when the scan is finished."""
+
+    def __init__(self, out=None, interval=10.0):
+        self.out = out
+        self.interval = interval
+        self.start = perf_counter()
+        self.phase = 'walk'
+        self.phase_start = self.start
+        self.phase_seconds = {'walk': 0.0, 'hash': 0.0, 'done': 0.0}
+        self.files_walked = 0
+        self.bytes_walked = 0
+        self.size_histogram = {}
+        self.stages = {}
+        # Counters are updated by the scan and read by the timer thread.
+        self.lock = Lock()
+        self.stopped = Event()
+        self.timer = None
+        if out is not None:
+            self.timer = Thread(target=self._run_timer, daemon=True)
+            self.timer.start()
+
+    def walked(self, size):
+        bucket = size.bit_length()
+        with self.lock:
+            self.files_walked += 1
+            self.bytes_walked += size
+            self.size_histogram[bucket] = \
+                self.size_histogram.get(bucket, 0) + 1
+
+    def walk_finished(self):
+        self._switch('hash')
+
+    def hashed(self, stage, bytes_read, seconds, hit=False):
+        with self.lock:
+            stat = self.stages.setdefault(
+                stage,
+                {'files': 0, 'cache_hits': 0, 'bytes': 0, 'busy': 0.0})
+            if hit:
+                stat['cache_hits'] += 1
+            else:
+                stat['files'] += 1
+                stat['bytes'] += bytes_read
+                stat['busy'] += seconds
+
+    def _switch(self, phase):
+        with self.lock:
+            now = perf_counter()
+            self.phase_seconds[self.phase] += now - self.phase_start
+            self.phase = phase
+            self.phase_start = now
+
+    def _run_timer(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        # Ends the periodic snapshots; may be called more than once.
+        self.stopped.set()
+        if self.timer is not None:
+            self.timer.join()
+            self.timer = None
+
+    def snapshot(self, final=False):
+        with self.lock:
+            return self._snapshot(final)
+
+    def _snapshot(self, final):
+        now = perf_counter()
+        phase_seconds = dict(self.phase_seconds)
+        phase_seconds[self.phase] += now - self.phase_start
+        hash_seconds = phase_seconds['hash']
+        bytes_read = sum(stat['bytes'] for stat in self.stages.values())
+        files_hashed = sum(stat['files'] for stat in self.stages.values())
+        return {
+            'time': time(),
+            'final': final,
+            'phase': self.phase,
+            'elapsed': now - self.start,
+            'walk_seconds': phase_seconds['walk'],
+            'hash_seconds': hash_seconds,
+            'files_walked': self.files_walked,
+            'bytes_walked': self.bytes_walked,
+            'files_hashed': files_hashed,
+            'bytes_read': bytes_read,
+            'mb_per_second':
+                bytes_read / hash_seconds / 2 ** 20 if hash_seconds else 0.0,
+            'files_per_second':
+                files_hashed / hash_seconds if hash_seconds else 0.0,
+            'stages': {stage: dict(stat)
+                       for stage, stat in self.stages.items()},
+            # Bucket n holds files of size in [2 ** (n - 1), 2 ** n).
+            'size_histogram': {str(bucket): count for bucket, count
+                               in sorted(self.size_histogram.items())},
+        }
+
+    def write(self, final=False):
+        print(json.dumps(self.snapshot(final)), file=self.out)
+        self.out.flush()
+
+    def finish(self):
+        self.stop()
+        self._switch('done')
+        if self.out is not None:
+            self.write(final=True)
+
+    def report(self, algorithm, out=None):
+        out = sys.stderr if out is None else out
+        snapshot = self.snapshot()
+        print('algorithm:', algorithm, file=out)
+        print('walk: {} files, {:.3f} s'.format(
+            snapshot['files_walked'], snapshot['walk_seconds']), file=out)
+        for stage, stat in snapshot['stages'].items():
+            speed = stat['bytes'] / stat['busy'] / 2 ** 20 \
+                if stat['busy'] else 0.0
+            print('{}: {} files, {} cached, {} bytes, {:.3f} s busy, '
+                  '{:.1f} MB/s'.format(stage, stat['files'],
+                                       stat['cache_hits'], stat['bytes'],
+                                       stat['busy'], speed), file=out)
+        print('hash: {:.3f} s, {:.1f} MB/s, {:.1f} files/s'.format(
+            snapshot['hash_seconds'], snapshot['mb_per_second'],
+            snapshot['files_per_second']), file=out)
@@ -0,0 +1,60 @@
+from array import array
+from os import path, fsdecode, fsencode
+
+
+class PathTable:
+
+    """PathTable - compact storage of scanned files.
+    Files are referenced by integer ids. Every directory is stored
+    once and shared by all its files, the stat fields live in typed
+    arrays instead of one stat_result object per file, and the file
+    names are encoded one after another in a single buffer."""
+
+    def __init__(self):
+        self.directories = []
+        self.directory_ids = {}
+        self.file_directories = array('L')
+        self.names = bytearray()
+        # The name of file i is names[name_offsets[i]:name_offsets[i + 1]].
+        self.name_offsets = array('Q', [0])
+        self.devices = array('Q')
+        self.inodes = array('Q')
+        self.sizes = array('Q')
+        self.mtimes = array('q')
+        self.nlinks = array('L')
+
+    def __len__(self):
+        return len(self.name_offsets) - 1
+
+    def add(self, directory, file_name, file_stat):
+        directory_id = self.directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = len(self.directories)
+            self.directory_ids[directory] = directory_id
+            self.directories.append(directory)
+        self.file_directories.append(directory_id)
+        self.names += fsencode(file_name)
+        self.name_offsets.append(len(self.names))
+        self.devices.append(file_stat.st_dev)
+        self.inodes.append(file_stat.st_ino)
+        self.sizes.append(file_stat.st_size)
+        self.mtimes.append(file_stat.st_mtime_ns)
+        self.nlinks.append(file_stat.st_nlink)
+        return len(self) - 1
+
+    def name(self, file_id):
+        return fsdecode(bytes(self.names[self.name_offsets[file_id]:
+                                         self.name_offsets[file_id + 1]]))
+
+    def path(self, file_id):
+        return path.join(self.directories[self.file_directories[file_id]],
+                         self.name(file_id))
+
+    def inode(self, file_id):
+        return self.devices[file_id], self.inodes[file_id]
+
+    def unchanged(self, file_id, file_stat):
+        return (file_stat.st_dev == self.devices[file_id] and
+                file_stat.st_ino == self.inodes[file_id] and
+                file_stat.st_size == self.sizes[file_id] and
+                file_stat.st_mtime_ns == self.mtimes[file_id])
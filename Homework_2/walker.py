@@ -0,0 +1,108 @@
+import sys
+from fnmatch import fnmatch
+from os import scandir, stat
+from stat import S_ISREG
+from time import time
+
+
+class FileFilter:
+
+    """FileFilter - the exclusion rules of a walk.
+    Hidden files (starting with '.' or '~') and symlinks are skipped.
+    exclude is a list of glob patterns matched against the name and the
+    full path of files and directories. Sizes are in bytes, ages (by
+    modification time) in seconds."""
+
+    def __init__(self, exclude=(), min_size=0, max_size=None,
+                 min_age=None, max_age=None):
+        self.exclude = exclude
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_age = min_age
+        self.max_age = max_age
+
+    def excluded(self, name, full_path):
+        return any(fnmatch(name, pattern) or fnmatch(full_path, pattern)
+                   for pattern in self.exclude)
+
+    def accepts(self, name, full_path, file_stat, now=None):
+        if name[0] in ['.', '~'] or not S_ISREG(file_stat.st_mode):
+            return False
+        if self.excluded(name, full_path):
+            return False
+        if file_stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and file_stat.st_size > self.max_size:
+            return False
+        age = (now or time()) - file_stat.st_mtime
+        if self.min_age is not None and age < self.min_age:
+            return False
+        if self.max_age is not None and age > self.max_age:
+            return False
+        return True
+
+
+def _unreadable(directory, error):
+    print('cannot read', directory, error.strerror, file=sys.stderr)
+
+
+def walk_files(roots, exclude=(), min_size=0, max_size=None,
+               min_age=None, max_age=None, one_file_system=False,
+               on_directory=None):
+    """Yield (directory, file name, stat) for every regular file under roots
+    accepted by a FileFilter with the given rules.
+
+    Excluded directories are never entered. With one_file_system the
+    walk does not cross into other devices. on_directory, if given, is
+    called with every directory entered. The stat of a file is the one
+    cached by its DirEntry. Directories that cannot be read are reported
+    on stderr and skipped, files that vanish during the walk are skipped."""
+    file_filter = FileFilter(exclude, min_size, max_size, min_age, max_age)
+    now = time()
+    visited = set()
+    for root in roots:
+        try:
+            root_device = stat(root).st_dev
+        except OSError as error:
+            _unreadable(root, error)
+            continue
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                directory_stat = stat(directory)
+                entries = scandir(directory)
+            except OSError as error:
+                _unreadable(directory, error)
+                continue
+            if (directory_stat.st_dev, directory_stat.st_ino) in visited:
+                # Overlapping roots must not yield the same file twice.
+                entries.close()
+                continue
+            visited.add((directory_stat.st_dev, directory_stat.st_ino))
+            if on_directory is not None:
+                on_directory(directory)
+            subdirectories = []
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if file_filter.excluded(entry.name, entry.path):
+                                continue
+                            if (not one_file_system or
+                                    entry.stat(follow_symlinks=False).st_dev ==
+                                    root_device):
+                                subdirectories.append(entry.path)
+                            continue
+                        if (entry.name[0] in ['.', '~'] or
+                                not entry.is_file(follow_symlinks=False)):
+                            continue
+                        file_stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        # Removed since the directory was listed.
+                        continue
+                    if file_filter.accepts(entry.name, entry.path,
+                                           file_stat, now):
+                        yield directory, entry.name, file_stat
+            # Reversed, so that subdirectories are walked in scandir order.
+            stack.extend(reversed(subdirectories))
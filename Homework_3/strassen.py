@@ -1,84 +1,543 @@
+import json
+import os
+import sys
 import numpy as np
-from math import log
-
-def _strassen(first, second):
-    matrix_len = len(first)
-    if matrix_len == 1:
-        return np.full((1, 1), first[0][0] * second[0][0])
-
-    new_len = matrix_len // 2
-    a = _split_matrix(first, new_len)
-    b = _split_matrix(second, new_len)
-
-    p_1 = _strassen(a[0, 0] + a[1, 1], b[0, 0] + b[1, 1])
-    p_2 = _strassen(a[1, 0] + a[1, 1], b[0, 0])
-    p_3 = _strassen(a[0, 0], b[0, 1] - b[1, 1])
-    p_4 = _strassen(a[1, 1], b[1, 0] - b[0, 0])
-    p_5 = _strassen(a[0, 0] + a[0, 1], b[1, 1])
-    p_6 = _strassen(a[1, 0] - a[0, 0], b[0, 0] + b[0, 1])
-    p_7 = _strassen(a[0, 1] - a[1, 1], b[1, 0] + b[1, 1])
-
-    result = _combine_matrix(p_1 + p_4 - p_5 + p_7, p_3 + p_5,
-                             p_2 + p_4, p_1 - p_2 + p_3 + p_6)
-    return result
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer
 
-def _combine_matrix(left_top, right_top, left_bottom, right_bottom):
-    result = np.hstack((left_top, right_top))
-    result = np.vstack((result, np.hstack((left_bottom, right_bottom))))
-    return result
+# Below this size blocks are multiplied by np.dot (BLAS): recursing
+# further only adds Python call and allocation overhead.
+DEFAULT_LEAF_SIZE = 64
+TUNING_FILE = os.path.join(os.path.expanduser("~"), ".strassen_tuning.json")
+INT64_LIMIT = 2 ** 63
+DEFAULT_MEMORY_BUDGET = 2 ** 30
+
+def _quadrants(matrix, rows, columns):
+    # Zero-copy views of the four rows x columns blocks (leading batch
+    # axes are kept). An odd last row or column is left out.
+    return (matrix[..., :rows, :columns],
+            matrix[..., :rows, columns:2 * columns],
+            matrix[..., rows:2 * rows, :columns],
+            matrix[..., rows:2 * rows, columns:2 * columns])
+
+def _is_leaf(rows, inner, columns, leaf_size):
+    return min(rows, inner, columns) <= leaf_size
+
+def _make_workspace(rows, inner, columns, leaf_size, dtype, batch_shape=()):
+    # Per recursion level: one buffer for a sum of blocks of the first
+    # matrix, one for the second and one for a product.
+    workspace = []
+    batch_shape = tuple(batch_shape)
+    while not _is_leaf(rows, inner, columns, leaf_size):
+        rows, inner, columns = rows // 2, inner // 2, columns // 2
+        workspace.append((np.empty(batch_shape + (rows, inner), dtype),
+                          np.empty(batch_shape + (inner, columns), dtype),
+                          np.empty(batch_shape + (rows, columns), dtype)))
+    return workspace
+
+def _peel(first, second, result):
+    # Completes a product whose even-sized part was computed by Strassen:
+    # an odd inner dimension adds a rank one update to that part, an odd
+    # last column or row of the result is a thin product done by BLAS.
+    rows, inner = first.shape[-2:]
+    columns = second.shape[-1]
+    even_rows = rows - rows % 2
+    even_inner = inner - inner % 2
+    even_columns = columns - columns % 2
+    if inner % 2:
+        core = result[..., :even_rows, :even_columns]
+        np.add(core, np.matmul(first[..., :even_rows, even_inner:],
+                               second[..., even_inner:, :even_columns]),
+               out=core)
+    if columns % 2:
+        np.matmul(first[..., :even_rows, :], second[..., even_columns:],
+                  out=result[..., :even_rows, even_columns:])
+    if rows % 2:
+        np.matmul(first[..., even_rows:, :], second,
+                  out=result[..., even_rows:, :])
+
+def _strassen_into(first, second, result, leaf_size, workspace, level=0):
+    rows, inner = first.shape[-2:]
+    columns = second.shape[-1]
+    if _is_leaf(rows, inner, columns, leaf_size):
+        np.matmul(first, second, out=result)
+        return
+
+    rows, inner, columns = rows // 2, inner // 2, columns // 2
+    a_11, a_12, a_21, a_22 = _quadrants(first, rows, inner)
+    b_11, b_12, b_21, b_22 = _quadrants(second, inner, columns)
+    c_11, c_12, c_21, c_22 = _quadrants(result, rows, columns)
+    s_a, s_b, p = workspace[level]
+
+    def multiply(left, right, out):
+        _strassen_into(left, right, out, leaf_size, workspace, level + 1)
+
+    # p_1 = (a_11 + a_22)(b_11 + b_22) goes to c_11 and c_22
+    multiply(np.add(a_11, a_22, out=s_a), np.add(b_11, b_22, out=s_b), c_11)
+    np.copyto(c_22, c_11)
+    # p_2 = (a_21 + a_22) b_11 goes to c_21, and is subtracted from c_22
+    multiply(np.add(a_21, a_22, out=s_a), b_11, c_21)
+    np.subtract(c_22, c_21, out=c_22)
+    # p_3 = a_11 (b_12 - b_22) goes to c_12 and c_22
+    multiply(a_11, np.subtract(b_12, b_22, out=s_b), c_12)
+    np.add(c_22, c_12, out=c_22)
+    # p_4 = a_22 (b_21 - b_11) goes to c_11 and c_21
+    multiply(a_22, np.subtract(b_21, b_11, out=s_b), p)
+    np.add(c_11, p, out=c_11)
+    np.add(c_21, p, out=c_21)
+    # p_5 = (a_11 + a_12) b_22 is subtracted from c_11, added to c_12
+    multiply(np.add(a_11, a_12, out=s_a), b_22, p)
+    np.subtract(c_11, p, out=c_11)
+    np.add(c_12, p, out=c_12)
+    # p_6 = (a_21 - a_11)(b_11 + b_12) goes to c_22
+    multiply(np.subtract(a_21, a_11, out=s_a),
+             np.add(b_11, b_12, out=s_b), p)
+    np.add(c_22, p, out=c_22)
+    # p_7 = (a_12 - a_22)(b_21 + b_22) goes to c_11
+    multiply(np.subtract(a_12, a_22, out=s_a),
+             np.add(b_21, b_22, out=s_b), p)
+    np.add(c_11, p, out=c_11)
+    _peel(first, second, result)
+
+def _winograd_into(first, second, result, leaf_size, workspace, level=0):
+    # Winograd's form of Strassen: the same seven products with 15 block
+    # additions instead of 18, as the sums are built from each other.
+    rows, inner = first.shape[-2:]
+    columns = second.shape[-1]
+    if _is_leaf(rows, inner, columns, leaf_size):
+        np.matmul(first, second, out=result)
+        return
+
+    rows, inner, columns = rows // 2, inner // 2, columns // 2
+    a_11, a_12, a_21, a_22 = _quadrants(first, rows, inner)
+    b_11, b_12, b_21, b_22 = _quadrants(second, inner, columns)
+    c_11, c_12, c_21, c_22 = _quadrants(result, rows, columns)
+    s_a, s_b, p = workspace[level]
+
+    def multiply(left, right, out):
+        _winograd_into(left, right, out, leaf_size, workspace, level + 1)
+
+    # p_7 = (a_11 - a_21)(b_22 - b_12) goes to c_21
+    multiply(np.subtract(a_11, a_21, out=s_a),
+             np.subtract(b_22, b_12, out=s_b), c_21)
+    # p_5 = s_1 t_1 = (a_21 + a_22)(b_12 - b_11) goes to c_22
+    multiply(np.add(a_21, a_22, out=s_a), np.subtract(b_12, b_11, out=s_b),
+             c_22)
+    # p_6 = s_2 t_2 = (s_1 - a_11)(b_22 - t_1) goes to c_12
+    multiply(np.subtract(s_a, a_11, out=s_a), np.subtract(b_22, s_b, out=s_b),
+             c_12)
+    # s_4 = a_12 - s_2; p_1 = a_11 b_11 goes to c_11
+    np.subtract(a_12, s_a, out=s_a)
+    multiply(a_11, b_11, c_11)
+    # u_2 = p_1 + p_6 in c_12, u_3 = u_2 + p_7 in c_21,
+    # u_4 = u_2 + p_5 in c_12, c_22 = u_3 + p_5
+    np.add(c_11, c_12, out=c_12)
+    np.add(c_12, c_21, out=c_21)
+    np.add(c_12, c_22, out=c_12)
+    np.add(c_21, c_22, out=c_22)
+    # p_3 = s_4 b_22: c_12 = u_4 + p_3
+    multiply(s_a, b_22, p)
+    np.add(c_12, p, out=c_12)
+    # p_4 = a_22 t_4 = a_22 (t_2 - b_21): c_21 = u_3 - p_4
+    multiply(a_22, np.subtract(s_b, b_21, out=s_b), p)
+    np.subtract(c_21, p, out=c_21)
+    # p_2 = a_12 b_21: c_11 = p_1 + p_2
+    multiply(a_12, b_21, p)
+    np.add(c_11, p, out=c_11)
+    _peel(first, second, result)
+
+def _strassen_task(first, second, result, leaf_size, variant="strassen"):
+    workspace = _make_workspace(first.shape[-2], first.shape[-1],
+                                second.shape[-1], leaf_size, result.dtype,
+                                result.shape[:-2])
+    VARIANTS[variant][0](first, second, result, leaf_size, workspace)
+
+def _combine_products(products, result, rows, columns):
+    p_1, p_2, p_3, p_4, p_5, p_6, p_7 = products
+    c_11, c_12, c_21, c_22 = _quadrants(result, rows, columns)
+    np.add(p_1, p_4, out=c_11)
+    np.subtract(c_11, p_5, out=c_11)
+    np.add(c_11, p_7, out=c_11)
+    np.add(p_3, p_5, out=c_12)
+    np.add(p_2, p_4, out=c_21)
+    np.subtract(p_1, p_2, out=c_22)
+    np.add(c_22, p_3, out=c_22)
+    np.add(c_22, p_6, out=c_22)
+
+def _strassen_operands(a_11, a_12, a_21, a_22, b_11, b_12, b_21, b_22):
+    return [(a_11 + a_22, b_11 + b_22), (a_21 + a_22, b_11),
+            (a_11, b_12 - b_22), (a_22, b_21 - b_11),
+            (a_11 + a_12, b_22), (a_21 - a_11, b_11 + b_12),
+            (a_12 - a_22, b_21 + b_22)]
+
+def _winograd_operands(a_11, a_12, a_21, a_22, b_11, b_12, b_21, b_22):
+    s_1 = a_21 + a_22
+    s_2 = s_1 - a_11
+    t_1 = b_12 - b_11
+    t_2 = b_22 - t_1
+    return [(a_11, b_11), (a_12, b_21), (a_12 - s_2, b_22),
+            (a_22, t_2 - b_21), (s_1, t_1), (s_2, t_2),
+            (a_11 - a_21, b_22 - b_12)]
+
+def _combine_winograd(products, result, rows, columns):
+    p_1, p_2, p_3, p_4, p_5, p_6, p_7 = products
+    c_11, c_12, c_21, c_22 = _quadrants(result, rows, columns)
+    np.add(p_1, p_2, out=c_11)
+    np.add(p_1, p_6, out=c_12)
+    np.add(c_12, p_7, out=c_21)
+    np.add(c_12, p_5, out=c_12)
+    np.add(c_12, p_3, out=c_12)
+    np.add(c_21, p_5, out=c_22)
+    np.subtract(c_21, p_4, out=c_21)
 
-def _split_matrix(matrix, part_len):
-    result = _combine_matrix([[matrix[:part_len, :part_len]]],
-                             [[matrix[:part_len, part_len:]]],
-                             [[matrix[part_len:, :part_len]]],
-                             [[matrix[part_len:, part_len:]]])
+# For each variant: the recursion on workspaces, and the operands of the
+# seven products and their combination for the levels unrolled by
+# _schedule.
+VARIANTS = {
+    "strassen": (_strassen_into, _strassen_operands, _combine_products),
+    "winograd": (_winograd_into, _winograd_operands, _combine_winograd),
+}
+
+def _schedule(first, second, result, leaf_size, variant, executor, depth,
+              futures, combines):
+    # The top `depth` levels are unrolled on this thread: their seven
+    # products get their own buffers, the products at the last unrolled
+    # level are submitted to the executor, and the combine steps are
+    # collected children first, to run once every product is ready.
+    # Workers never wait for each other, so the pool cannot deadlock.
+    rows, inner = first.shape[-2:]
+    columns = second.shape[-1]
+    if depth == 0 or _is_leaf(rows, inner, columns, leaf_size):
+        futures.append(executor.submit(_strassen_task, first, second,
+                                       result, leaf_size, variant))
+        return
+    _, make_operands, combine_products = VARIANTS[variant]
+    rows, inner, columns = rows // 2, inner // 2, columns // 2
+    operands = make_operands(*(_quadrants(first, rows, inner) +
+                               _quadrants(second, inner, columns)))
+    products = [np.empty(result[..., :rows, :columns].shape, result.dtype)
+                for _ in operands]
+    for (left, right), product in zip(operands, products):
+        _schedule(left, right, product, leaf_size, variant, executor,
+                  depth - 1, futures, combines)
+
+    def combine():
+        combine_products(products, result, rows, columns)
+        _peel(first, second, result)
+
+    combines.append(combine)
+
+def _strassen(first, second, leaf_size=DEFAULT_LEAF_SIZE, workers=1,
+              parallel_depth=1, variant="strassen"):
+    # Blocks are views, sums and products go to buffers allocated once
+    # per call, and products are accumulated in place in the result.
+    # Odd dimensions are peeled off at every level instead of padding,
+    # so any m x k by k x n product costs close to its own size.
+    # With several workers the products of the top parallel_depth levels
+    # (7 or 49 of them) run on a thread pool: BLAS and the ufuncs
+    # release the GIL. BLAS threads per worker may need to be limited
+    # (OMP_NUM_THREADS) to avoid oversubscribing the cores.
+    batch_shape = np.broadcast_shapes(first.shape[:-2], second.shape[:-2])
+    result = np.empty(batch_shape + (first.shape[-2], second.shape[-1]),
+                      first.dtype)
+    if workers <= 1 or parallel_depth <= 0:
+        _strassen_task(first, second, result, leaf_size, variant)
+        return result
+    futures = []
+    combines = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        _schedule(first, second, result, leaf_size, variant, executor,
+                  parallel_depth, futures, combines)
+        for future in futures:
+            future.result()
+    for combine in combines:
+        combine()
     return result
 
-def _is_pow2(x):
-    log2 = log(x, 2)
-    return log2 == int(log2)
-
-def _get_new_len(old_len):
-    new_len = old_len
-    while not _is_pow2(new_len):
-        new_len += 1
-    return new_len
-
-def _prepare_matrix(matrix, old_len, new_len):
-    delta_len = new_len - old_len
-    matrix = np.hstack([matrix, np.zeros((old_len, delta_len))])
-    matrix = np.vstack([matrix, np.zeros((delta_len, new_len))])
-    return matrix
-
-def strassen_algorithm(first, second):
-    old_len = len(first)
-    new_len = _get_new_len(old_len)
-    
-    first_prepared = _prepare_matrix(first, old_len, new_len)
-    second_prepared = _prepare_matrix(second, old_len, new_len)
+def _max_abs(matrix):
+    return max(abs(int(matrix.max())), abs(int(matrix.min())))
+
+def _exact_dtype(first, second):
+    # Floats keep their type. Integers are multiplied in int64 when no
+    # entry of the result can overflow it: intermediate sums may wrap
+    # around, but the arithmetic is exact modulo 2 ** 64, so the result
+    # is too. Larger products are computed on Python ints.
+    dtype = np.result_type(first, second)
+    if dtype.kind not in "biu":
+        return dtype
+    if first.size == 0 or second.size == 0:
+        return np.dtype(np.int64)
+    bound = _max_abs(first) * _max_abs(second) * first.shape[-1]
+    return np.dtype(np.int64) if bound < INT64_LIMIT else np.dtype(object)
+
+_tuned_leaf_size = None
+
+def load_leaf_size():
+    # The tuning file is read once per process, not on every product;
+    # tune_leaf_size updates the cached value when it saves a new one.
+    global _tuned_leaf_size
+    if _tuned_leaf_size is None:
+        try:
+            with open(TUNING_FILE) as f:
+                _tuned_leaf_size = int(json.load(f)["leaf_size"])
+        except (OSError, ValueError, KeyError):
+            _tuned_leaf_size = DEFAULT_LEAF_SIZE
+    return _tuned_leaf_size
+
+def strassen_algorithm(first, second, leaf_size=None, workers=1,
+                       parallel_depth=1, variant="strassen"):
+    if leaf_size is None:
+        leaf_size = load_leaf_size()
+    first = np.asarray(first)
+    second = np.asarray(second)
+    _check_shapes(first, second)
+    _check_variant(variant)
+    dtype = _exact_dtype(first, second)
+    return _strassen(first.astype(dtype, copy=False),
+                     second.astype(dtype, copy=False), leaf_size,
+                     workers, parallel_depth, variant)
 
-    result_strassen = _strassen(first_prepared, second_prepared)
-    result = result_strassen[:old_len, :old_len]
+def strassen_batch(first, second, leaf_size=None, workers=1,
+                   variant="strassen"):
+    """Multiply two stacks of matrices pair by pair.
+
+    first is a (batch, m, k) and second a (batch, k, n) array. The whole
+    stack goes through one recursion: at every level each block sum is
+    one ufunc call for all pairs, written to a workspace shared by the
+    batch, and the leaves are one batched np.matmul. With several
+    workers the stack is split between threads instead."""
+    if leaf_size is None:
+        leaf_size = load_leaf_size()
+    first = np.asarray(first)
+    second = np.asarray(second)
+    _check_shapes(first, second)
+    _check_variant(variant)
+    if first.ndim != 3 or second.ndim != 3 or len(first) != len(second):
+        raise ValueError("expected two stacks of the same number of "
+                         "matrices, got shapes {} and {}".format(
+                             first.shape, second.shape))
+    dtype = _exact_dtype(first, second)
+    first = first.astype(dtype, copy=False)
+    second = second.astype(dtype, copy=False)
+    result = np.empty((len(first), first.shape[1], second.shape[2]), dtype)
+    if workers <= 1 or len(first) <= 1:
+        _strassen_task(first, second, result, leaf_size, variant)
+        return result
+    bounds = np.linspace(0, len(first), min(workers, len(first)) + 1,
+                         dtype=int)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_strassen_task, first[start:end],
+                                   second[start:end], result[start:end],
+                                   leaf_size, variant)
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            future.result()
     return result
 
-def _read_matrix(matrix_len):
-    matrix = np.empty((matrix_len, matrix_len))
-    for row in range(matrix_len):
-        row_values = input().split()
-        matrix[row] = [int(value) for value in row_values]
-    return matrix
+def _check_shapes(first, second):
+    if (first.ndim < 2 or second.ndim < 2 or
+            first.shape[-1] != second.shape[-2]):
+        raise ValueError("matrices of shapes {} and {} cannot be "
+                         "multiplied".format(first.shape, second.shape))
+
+def _check_variant(variant):
+    if variant not in VARIANTS:
+        raise ValueError("unknown variant {!r}, expected one of {}".format(
+            variant, ", ".join(VARIANTS)))
+
+def _tile_len(memory_budget, itemsize, workers=1, parallel_depth=0):
+    # A step holds a tile of each operand, the accumulated result tile,
+    # the product of the two tiles, the Strassen workspace (less than
+    # one more tile) and temporaries of the recursion: about six square
+    # tiles in all.
+    tiles = 6.0
+    if workers > 1 and parallel_depth > 0:
+        # _schedule gives each block of an unrolled level 7 products
+        # and up to 10 operand sums a quarter of its size, and every
+        # running task has a workspace of the size of its block.
+        for level in range(parallel_depth):
+            tiles += 17 / 4 * (7 / 4) ** level
+        tiles += min(workers, 7 ** parallel_depth) / 4 ** parallel_depth
+    return max(1, int((memory_budget / (tiles * itemsize)) ** 0.5))
+
+def _max_abs_tiled(matrix, memory_budget):
+    # One pass over a mapped matrix, by blocks of rows that fit in
+    # memory_budget, instead of a pass for max() and one for min().
+    rows_per_block = max(1, memory_budget // max(1, matrix[:1].nbytes))
+    largest = 0
+    for row in range(0, len(matrix), rows_per_block):
+        block = np.asarray(matrix[row:row + rows_per_block])
+        largest = max(largest, _max_abs(block))
+    return largest
+
+def strassen_out_of_core(first, second, out, memory_budget=None,
+                         leaf_size=None, workers=1, parallel_depth=1,
+                         variant="strassen", max_abs=None):
+    """Multiply two matrices that need not fit in memory.
+
+    first and second are 2-D arrays, typically np.memmap or .npy files
+    opened with mmap_mode="r". out is an array of the result shape or
+    the name of a .npy file to create, it is returned. The product is
+    computed by square tiles sized so that a step uses about
+    memory_budget bytes: every tile product is done by Strassen in
+    memory and the result tiles are written to out as they are done.
+    Integer products are computed in int64, which must not overflow:
+    the operands are read once to bound their entries, unless max_abs,
+    a bound on the absolute value of every entry of both, is given."""
+    if leaf_size is None:
+        leaf_size = load_leaf_size()
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_BUDGET
+    _check_shapes(first, second)
+    _check_variant(variant)
+    if first.ndim != 2 or second.ndim != 2:
+        raise ValueError("out-of-core multiplication needs 2-D matrices")
+    rows, inner = first.shape
+    columns = second.shape[1]
+    dtype = np.result_type(first, second)
+    if dtype.kind in "biu":
+        dtype = np.dtype(np.int64)
+        if first.size and second.size:
+            if max_abs is not None:
+                bound = max_abs * max_abs * inner
+            else:
+                bound = (_max_abs_tiled(first, memory_budget) *
+                         _max_abs_tiled(second, memory_budget) * inner)
+            if bound >= INT64_LIMIT:
+                raise ValueError("the product may overflow int64")
+    elif dtype.kind == "O":
+        raise ValueError("object arrays cannot be multiplied out of core")
+    if isinstance(out, (str, os.PathLike)):
+        out = np.lib.format.open_memmap(out, mode="w+", dtype=dtype,
+                                        shape=(rows, columns))
+    elif out.shape != (rows, columns):
+        raise ValueError("out has shape {}, expected {}".format(
+            out.shape, (rows, columns)))
+    tile_len = _tile_len(memory_budget, dtype.itemsize, workers,
+                         parallel_depth)
+    for row in range(0, rows, tile_len):
+        row_end = min(row + tile_len, rows)
+        for column in range(0, columns, tile_len):
+            column_end = min(column + tile_len, columns)
+            result = np.zeros((row_end - row, column_end - column), dtype)
+            for step in range(0, inner, tile_len):
+                step_end = min(step + tile_len, inner)
+                # astype copies the tiles from the mapped files to memory.
+                product = _strassen(
+                    first[row:row_end, step:step_end].astype(dtype),
+                    second[step:step_end, column:column_end].astype(dtype),
+                    leaf_size, workers, parallel_depth, variant)
+                np.add(result, product, out=result)
+            out[row:row_end, column:column_end] = result
+        if isinstance(out, np.memmap):
+            # Bounds the dirty pages kept by the mapping.
+            out.flush()
+    return out
+
+def _best_time(function, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = default_timer()
+        function()
+        best = min(best, default_timer() - start)
+    return best
+
+def tune_leaf_size(matrix_len=2048, repeats=3, save=True, out=None):
+    global _tuned_leaf_size
+    # Tries every power-of-two leaf size and matrix_len itself on random
+    # matrices and keeps the fastest one. A leaf size equal to
+    # matrix_len is plain np.dot, so it is chosen when Strassen does not
+    # pay off on this machine.
+    out = sys.stdout if out is None else out
+    first = np.random.rand(matrix_len, matrix_len)
+    second = np.random.rand(matrix_len, matrix_len)
+    numpy_time = _best_time(lambda: np.matmul(first, second), repeats)
+    print("np.matmul: {:.4f} s".format(numpy_time), file=out)
+    timings = {}
+    candidates = []
+    leaf_size = 16
+    while leaf_size < matrix_len:
+        candidates.append(leaf_size)
+        leaf_size *= 2
+    candidates.append(matrix_len)
+    for leaf_size in candidates:
+        timings[leaf_size] = _best_time(
+            lambda: strassen_algorithm(first, second, leaf_size), repeats)
+        print("leaf size {}: {:.4f} s".format(leaf_size, timings[leaf_size]),
+              file=out)
+    best = min(timings, key=timings.get)
+    print("best leaf size: {}".format(best), file=out)
+    if save:
+        with open(TUNING_FILE, "w") as f:
+            json.dump({"leaf_size": best, "matrix_len": matrix_len,
+                       "seconds": timings[best],
+                       "numpy_seconds": numpy_time}, f)
+        _tuned_leaf_size = best
+    return best
+
+def _read_matrices(stream):
+    # The whole input is parsed by one NumPy call: the matrix size and
+    # then the rows of both matrices. The parser saturates values that
+    # do not fit int64, those inputs are parsed again as Python ints.
+    data = stream.read()
+    values = np.fromstring(data, dtype=np.int64, sep=" ")
+    if (values == np.iinfo(np.int64).max).any() or \
+            (values == np.iinfo(np.int64).min).any():
+        values = np.array([int(value) for value in data.split()])
+    matrix_len = int(values[0])
+    if len(values) != 1 + 2 * matrix_len * matrix_len:
+        raise ValueError("expected two {0}x{0} matrices".format(matrix_len))
+    matrices = values[1:].reshape(2, matrix_len, matrix_len)
+    return matrices[0], matrices[1]
 
-def _print_matrix(matrix):
-    matrix_len = len(matrix)
-    for row in range(matrix_len):
-        print(" ".join(map(str, map(int, matrix[row]))))
+def _write_matrix(matrix, out, block_rows=1024):
+    # Blocks of rows become Python numbers with one tolist() call and
+    # are written with one write() each.
+    for start in range(0, len(matrix), block_rows):
+        rows = matrix[start:start + block_rows].tolist()
+        out.write("\n".join(" ".join(map(str, row)) for row in rows))
+        out.write("\n")
 
 def main():
-    matrix_len = int(input())
-    first = _read_matrix(matrix_len)
-    second = _read_matrix(matrix_len)
-    result = strassen_algorithm(first, second)
-    _print_matrix(result)
+    args = sys.argv[1:]
+    if args[:1] == ["--tune"]:
+        matrix_len = int(args[1]) if len(args) > 1 else 2048
+        tune_leaf_size(matrix_len)
+        return
+    # --first and --second read the matrices from .npy files instead of
+    # stdin, --output saves the result as .npy instead of printing it.
+    # With --memory BYTES the .npy files are memory mapped and multiplied
+    # out of core by tiles that fit in BYTES. --variant winograd uses
+    # the Strassen-Winograd recursion.
+    options = {"-j": 1, "--depth": 1, "--first": None, "--second": None,
+               "--output": None, "--memory": None, "--variant": "strassen"}
+    while len(args) >= 2 and args[0] in options:
+        options[args[0]] = args[1]
+        args = args[2:]
+    if (options["--first"] is None) != (options["--second"] is None):
+        sys.exit("--first and --second must be given together")
+    if options["--memory"] is not None:
+        if options["--first"] is None or options["--output"] is None:
+            sys.exit("--memory needs --first, --second and --output")
+        strassen_out_of_core(np.load(options["--first"], mmap_mode="r"),
+                             np.load(options["--second"], mmap_mode="r"),
+                             options["--output"], int(options["--memory"]),
+                             workers=int(options["-j"]),
+                             parallel_depth=int(options["--depth"]),
+                             variant=options["--variant"])
+        return
+    if options["--first"] is not None:
+        first = np.load(options["--first"])
+        second = np.load(options["--second"])
+    else:
+        first, second = _read_matrices(sys.stdin.buffer)
+    result = strassen_algorithm(first, second, workers=int(options["-j"]),
+                                parallel_depth=int(options["--depth"]),
+                                variant=options["--variant"])
+    if options["--output"] is not None:
+        np.save(options["--output"], result)
+    else:
+        _write_matrix(result, sys.stdout)
     
 if __name__ == '__main__':
     main()